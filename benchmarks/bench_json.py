@@ -0,0 +1,124 @@
+"""
+Benchmark for JSON response encoding.
+
+Builds a 1,000-activity catalogue with 20 participants each and serves it
+from a small FastAPI app in several ways, timing whole requests through
+the TestClient:
+
+- dict: a plain dict returned from a route, FastAPI's stock path
+  (jsonable_encoder, then JSONResponse)
+- fast_dict: the same dict returned as a FastJSONResponse
+- typed: a route declaring a response_model, FastAPI's stock path for it
+  (pydantic validates and serializes straight to bytes); this is how the
+  app's typed routes are served
+- typed_custom_class: the same route with FastJSONResponse as its response
+  class, which makes FastAPI dump the model to a dict before encoding it;
+  this is why FastJSONResponse is not the app-wide default
+
+It also times just encoding the GET /activities body, json.dumps vs
+dumps(). Each figure is the best of several rounds. Every variant must
+decode to the same JSON.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_json
+"""
+
+import json
+import sys
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from src.fastjson import BACKEND, FastJSONResponse, dumps, stdlib_dumps
+
+ACTIVITIES = 1_000
+PARTICIPANTS = 20
+ROUNDS = 5
+REPEAT = 20
+
+
+class Activity(BaseModel):
+    description: str
+    schedule: str
+    max_participants: int
+    participants: list[str]
+
+
+def synthetic():
+    return {
+        f"Activity {i}": {
+            "description": f"Practice and compete with club number {i}",
+            "schedule": "Mondays and Wednesdays, 3:30 PM - 5:00 PM",
+            "max_participants": PARTICIPANTS + 10,
+            "participants": [f"student{i}-{j}@mergington.edu" for j in range(PARTICIPANTS)],
+        }
+        for i in range(ACTIVITIES)
+    }
+
+
+def build_app(catalogue):
+    app = FastAPI()
+
+    @app.get("/dict")
+    def plain_dict():
+        return catalogue
+
+    @app.get("/fast_dict")
+    def fast_dict():
+        return FastJSONResponse(catalogue)
+
+    @app.get("/typed", response_model=dict[str, Activity])
+    def typed():
+        return catalogue
+
+    @app.get("/typed_custom_class", response_model=dict[str, Activity],
+             response_class=FastJSONResponse)
+    def typed_custom_class():
+        return catalogue
+
+    return app
+
+
+def best_ms(function):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            function()
+        best = min(best, (time.perf_counter() - start) / REPEAT)
+    return round(best * 1000, 3)
+
+
+def main():
+    catalogue = synthetic()
+    expected = json.loads(stdlib_dumps(catalogue))
+
+    identical = json.loads(dumps(catalogue)) == expected
+    results = {
+        "activities_body_ms": {
+            "json.dumps": best_ms(lambda: stdlib_dumps(catalogue)),
+            "dumps": best_ms(lambda: dumps(catalogue)),
+        },
+        "request_ms": {},
+    }
+    with TestClient(build_app(catalogue)) as client:
+        for route in ("dict", "fast_dict", "typed", "typed_custom_class"):
+            identical = identical and client.get(f"/{route}").json() == expected
+            results["request_ms"][route] = best_ms(lambda: client.get(f"/{route}"))
+
+    print(json.dumps({
+        "activities": ACTIVITIES,
+        "participants_per_activity": PARTICIPANTS,
+        "serializer": BACKEND,
+        **results,
+        "identical": identical,
+    }, indent=2))
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark for participant membership, add and remove.
+
+Compares the dict-backed ParticipantRoster against the plain list the store
+used before, at 10, 1k and 100k participants.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_participants
+"""
+
+import timeit
+
+from src.participants import ParticipantRoster
+
+SIZES = [10, 1_000, 100_000]
+NUMBER = 2_000
+
+
+def _emails(n):
+    return [f"student{i}@mergington.edu" for i in range(n)]
+
+
+def _per_call_ns(stmt, setup_globals):
+    total = timeit.timeit(stmt, globals=setup_globals, number=NUMBER)
+    return total / NUMBER * 1e9
+
+
+def bench(size):
+    emails = _emails(size)
+    # Worst case for a list: the email we look for sits at the end
+    target = emails[-1]
+    newcomer = "newcomer@mergington.edu"
+    results = {}
+
+    as_list = list(emails)
+    results["list"] = {
+        "contains": _per_call_ns("target in coll", {"coll": as_list, "target": target}),
+        "add+remove": _per_call_ns(
+            "newcomer not in coll and coll.append(newcomer); coll.remove(newcomer)",
+            {"coll": as_list, "newcomer": newcomer},
+        ),
+    }
+
+    roster = ParticipantRoster(emails)
+    results["roster"] = {
+        "contains": _per_call_ns("target in coll", {"coll": roster, "target": target}),
+        "add+remove": _per_call_ns(
+            "coll.add(newcomer); coll.remove(newcomer)",
+            {"coll": roster, "newcomer": newcomer},
+        ),
+    }
+    return results
+
+
+def main():
+    print(f"{'size':>8}  {'collection':<8}  {'contains (ns)':>14}  {'add+remove (ns)':>16}")
+    for size in SIZES:
+        for kind, timings in bench(size).items():
+            print(f"{size:>8}  {kind:<8}  {timings['contains']:>14.1f}  "
+                  f"{timings['add+remove']:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
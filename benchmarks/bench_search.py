@@ -0,0 +1,74 @@
+"""
+Latency benchmark for the activity search index.
+
+Builds a SearchIndex over a synthetic catalogue of 10k activities and
+reports build time and p50/p99 query latency for exact, prefix and
+multi-word queries.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_search
+"""
+
+import json
+import random
+import statistics
+import time
+
+from src.search import SearchIndex
+
+ACTIVITIES = 10_000
+QUERIES = 2_000
+SEED = 42
+
+WORDS = (
+    "art band basketball biology chess chemistry choir club coding competition "
+    "dance debate design drama engineering film garden history journalism math "
+    "music orchestra painting photography physics poetry programming robotics "
+    "science soccer swimming team tennis theater volleyball writing yearbook "
+    "learn practice compete explore build perform create study improve join"
+).split()
+
+
+def catalogue(rng):
+    for i in range(ACTIVITIES):
+        name = " ".join(rng.sample(WORDS, 2)).title() + f" {i}"
+        description = " ".join(rng.choices(WORDS, k=12))
+        yield name, description
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    rng = random.Random(SEED)
+    index = SearchIndex()
+    start = time.perf_counter()
+    for name, description in catalogue(rng):
+        index.add(name, description)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    kinds = {
+        "exact": lambda: rng.choice(WORDS),
+        "prefix": lambda: rng.choice(WORDS)[:3],
+        "two_words": lambda: " ".join(rng.sample(WORDS, 2)),
+    }
+    results = {"activities": ACTIVITIES, "build_ms": round(build_ms, 1)}
+    for kind, make_query in kinds.items():
+        samples = []
+        for _ in range(QUERIES):
+            query = make_query()
+            start = time.perf_counter()
+            index.search(query)
+            samples.append((time.perf_counter() - start) * 1e6)
+        results[kind] = {
+            "p50_us": round(statistics.median(samples), 1),
+            "p99_us": round(percentile(samples, 0.99), 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Throughput scaling from 1 to N uvicorn workers sharing one SQLite store.
+
+Starts `uvicorn src.app:app --workers N` on a local port for each worker
+count, drives it from several client processes with a read-heavy mix
+(GET /activities plus signup/unregister churn) and prints requests per
+second. Every run ends with a consistency check: the roster seen through
+the API must never exceed max_participants.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_workers --workers 1 2 4 --duration 10
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+HOST = "127.0.0.1"
+CHURN_ACTIVITY = "Gym Class"
+WRITE_RATIO = 0.1
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_server(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(HOST, port, timeout=1)
+            conn.request("GET", "/activities")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("uvicorn did not start in time")
+
+
+def _client(port, duration, client_id):
+    """Issue requests for `duration` seconds on one keep-alive connection"""
+    rng = random.Random(client_id)
+    conn = http.client.HTTPConnection(HOST, port, timeout=10)
+    activity = quote(CHURN_ACTIVITY)
+    done = errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        if rng.random() < WRITE_RATIO:
+            email = quote(f"bench{client_id}-{done}@mergington.edu")
+            requests = [
+                ("POST", f"/activities/{activity}/signup?email={email}"),
+                ("DELETE", f"/activities/{activity}/unregister?email={email}"),
+            ]
+        else:
+            requests = [("GET", "/activities")]
+        for method, path in requests:
+            conn.request(method, path)
+            response = conn.getresponse()
+            response.read()
+            # A full activity is an expected answer under churn
+            if response.status >= 500:
+                errors += 1
+            done += 1
+    conn.close()
+    return done, errors
+
+
+def run(workers, clients, duration):
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            ACTIVITIES_STORE="sqlite",
+            ACTIVITIES_SQLITE_PATH=os.path.join(tmp, "activities.db"),
+            # All clients share one IP; measure throughput, not the limits
+            ACTIVITIES_RATE_LIMIT_IP="0/0",
+            ACTIVITIES_RATE_LIMIT_EMAIL="0/0",
+            ACTIVITIES_MAX_IN_FLIGHT="0",
+            ACTIVITIES_SLOW_REQUEST_MS="0",
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.app:app",
+             "--host", HOST, "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            _wait_for_server(port)
+            with multiprocessing.Pool(clients) as pool:
+                start = time.perf_counter()
+                results = pool.starmap(
+                    _client, [(port, duration, i) for i in range(clients)]
+                )
+                elapsed = time.perf_counter() - start
+
+            conn = http.client.HTTPConnection(HOST, port)
+            conn.request("GET", "/activities")
+            catalogue = json.loads(conn.getresponse().read())
+            conn.close()
+        finally:
+            server.terminate()
+            server.wait()
+
+    over_capacity = [
+        name for name, details in catalogue.items()
+        if len(details["participants"]) > details["max_participants"]
+    ]
+    total = sum(done for done, _ in results)
+    return {
+        "workers": workers,
+        "clients": clients,
+        "requests": total,
+        "errors": sum(errors for _, errors in results),
+        "requests_per_second": round(total / elapsed, 1),
+        "over_capacity": over_capacity,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    results = [run(workers, args.clients, args.duration) for workers in args.workers]
+    print(json.dumps(results, indent=2))
+    if any(result["over_capacity"] or result["errors"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Load test for the activities API, in-process and over a local socket.
+
+Runs three scenarios against the app:
+
+- poll: read-heavy polling of GET /activities, half of it revalidating
+  with If-None-Match the way the frontend does
+- signup_storm: every request signs a new student up for the same activity
+- churn: a mix of signups and unregisters spread over all activities
+
+Each scenario runs once through httpx's ASGI transport, which measures the
+app without any networking, and once against `uvicorn src.app:app` on a
+local port. Request order comes from a fixed seed, so runs are comparable.
+Results are printed as JSON with throughput, p50/p95/p99 latency and a
+count per status code; save them with --output and compare them between
+builds. Rate limiting, load shedding and the slow-request log are turned
+off, since every request comes from one client.
+
+Run from the repository root:
+
+    python -m benchmarks.loadtest --requests 2000 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+HOST = "127.0.0.1"
+SEED = 42
+STORM_ACTIVITY = "Chess Club"
+
+UNLIMITED = {
+    "ACTIVITIES_RATE_LIMIT_IP": "0/0",
+    "ACTIVITIES_RATE_LIMIT_EMAIL": "0/0",
+    "ACTIVITIES_MAX_IN_FLIGHT": "0",
+    "ACTIVITIES_SLOW_REQUEST_MS": "0",
+}
+
+
+def poll_requests(count, rng, etag):
+    for _ in range(count):
+        headers = {"If-None-Match": etag} if etag and rng.random() < 0.5 else {}
+        yield "GET", "/activities", None, headers
+
+
+def storm_requests(count, run_id):
+    for i in range(count):
+        yield "POST", f"/activities/{STORM_ACTIVITY}/signup", \
+            {"email": f"storm{run_id}-{i}@mergington.edu"}, {}
+
+
+def churn_requests(count, rng, activities, run_id):
+    students = [f"churn{run_id}-{i}@mergington.edu" for i in range(max(1, count // 10))]
+    for _ in range(count):
+        op = "signup" if rng.random() < 0.6 else "unregister"
+        method = "POST" if op == "signup" else "DELETE"
+        yield method, f"/activities/{rng.choice(activities)}/{op}", \
+            {"email": rng.choice(students)}, {}
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def drive(client, requests, concurrency):
+    """Send requests with `concurrency` in flight; returns a result dict"""
+    requests = iter(requests)
+    latencies = []
+    statuses = {}
+
+    async def worker():
+        for method, path, params, headers in requests:
+            start = time.perf_counter()
+            response = await client.request(method, path, params=params, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+async def run_scenarios(client, count, concurrency, run_id):
+    rng = random.Random(SEED)
+    response = await client.get("/activities")
+    catalogue = response.json()
+    etag = response.headers.get("etag")
+
+    results = {
+        "poll": await drive(client, poll_requests(count, rng, etag), concurrency),
+        "signup_storm": await drive(client, storm_requests(count, run_id), concurrency),
+        "churn": await drive(
+            client, churn_requests(count, rng, sorted(catalogue), run_id), concurrency
+        ),
+    }
+
+    # However the storm went, the roster must not be over capacity
+    activity = (await client.get("/activities")).json()[STORM_ACTIVITY]
+    results["signup_storm"]["capacity_held"] = (
+        len(activity["participants"]) <= activity["max_participants"]
+    )
+    return results
+
+
+async def run_asgi(count, concurrency):
+    os.environ.update(UNLIMITED)
+    from src.app import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        return await run_scenarios(client, count, concurrency, "asgi")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for_server(client, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await client.get("/activities")
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run_socket(count, concurrency, store):
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            **UNLIMITED,
+            ACTIVITIES_STORE=store,
+            ACTIVITIES_SQLITE_PATH=os.path.join(tmp, "activities.db"),
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.app:app",
+             "--host", HOST, "--port", str(port), "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            limits = httpx.Limits(max_connections=concurrency)
+            async with httpx.AsyncClient(
+                base_url=f"http://{HOST}:{port}", limits=limits, timeout=30.0
+            ) as client:
+                await _wait_for_server(client)
+                return await run_scenarios(client, count, concurrency, "socket")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--transport", choices=("asgi", "socket", "both"), default="both")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--store", choices=("memory", "sqlite"),
+                        default=os.environ.get("ACTIVITIES_STORE", "memory"))
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    os.environ["ACTIVITIES_STORE"] = args.store
+    report = {
+        "requests_per_scenario": args.requests,
+        "concurrency": args.concurrency,
+        "store": args.store,
+        "python": sys.version.split()[0],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("ACTIVITIES_SQLITE_PATH", os.path.join(tmp, "activities.db"))
+        if args.transport in ("asgi", "both"):
+            report["asgi"] = asyncio.run(run_asgi(args.requests, args.concurrency))
+    if args.transport in ("socket", "both"):
+        report["socket"] = asyncio.run(run_socket(args.requests, args.concurrency, args.store))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(text + "\n")
+
+    held = all(
+        results["signup_storm"]["capacity_held"]
+        for key, results in report.items() if key in ("asgi", "socket")
+    )
+    if not held:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Concurrency stress check for capacity enforcement.
+
+Fires thousands of concurrent signups at the 12-seat "Chess Club" through
+the ASGI app and exits non-zero if the roster ever ends up over capacity.
+Signups for a second activity run alongside to exercise per-activity locks.
+Set ACTIVITIES_STORE=sqlite to run it against the SQLite backend instead.
+
+Run from the repository root:
+
+    python -m benchmarks.stress_signups
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+
+# Every request comes from one test client; measure the store, not the
+# limits or the slow-request log
+os.environ.setdefault("ACTIVITIES_RATE_LIMIT_IP", "0/0")
+os.environ.setdefault("ACTIVITIES_RATE_LIMIT_EMAIL", "0/0")
+os.environ.setdefault("ACTIVITIES_MAX_IN_FLIGHT", "0")
+os.environ.setdefault("ACTIVITIES_SLOW_REQUEST_MS", "0")
+
+from src.app import app, store  # noqa: E402
+
+SIGNUPS = 5_000
+WORKERS = 64
+
+
+def main():
+    client = TestClient(app)
+    start = threading.Barrier(WORKERS)
+
+    def signup(i):
+        # Line every worker up once so the first wave really is concurrent
+        if i < WORKERS:
+            start.wait()
+        activity = "Chess Club" if i % 2 == 0 else "Gym Class"
+        response = client.post(
+            f"/activities/{activity}/signup",
+            params={"email": f"student{i}@mergington.edu"},
+        )
+        return activity, response.status_code
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(pool.map(signup, range(SIGNUPS)))
+
+    failed = False
+    for name in ("Chess Club", "Gym Class"):
+        activity = store.get_activity(name)
+        accepted = sum(1 for a, status in results if a == name and status == 200)
+        seats = len(activity["participants"])
+        print(f"{name}: {accepted} accepted, {seats}/{activity['max_participants']} seats")
+        if seats > activity["max_participants"]:
+            failed = True
+
+    listed = client.get("/activities").json()
+    for name in ("Chess Club", "Gym Class"):
+        if len(listed[name]["participants"]) > listed[name]["max_participants"]:
+            failed = True
+
+    if failed:
+        print("FAIL: an activity went over capacity")
+        sys.exit(1)
+    print("OK: capacity held")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,77 +5,415 @@ A super simple FastAPI application that allows students to view and sign up
 for extracurricular activities at Mergington High School.
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import (Depends, FastAPI, Header, HTTPException, Query, Request, WebSocket,
+                     WebSocketDisconnect)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from pydantic import BaseModel, PositiveFloat
+import asyncio
+import base64
+import json
+import logging
 import os
+import secrets
+import threading
+from contextlib import asynccontextmanager
+from collections import deque
 from pathlib import Path
 
+from .catalogue import CatalogueWatcher, load_catalogue
+from .events import ChangeRelay, EventHub, RosterSubscription
+from .fastjson import FastJSONResponse, dumps
+from .idempotency import IdempotencyMiddleware, ResponseCache
+from .lottery import LotteryClosed, PreferenceBook, allocate, confirm
+from .profiler import APP_ROOT, Sampler, SlowRequestLog, collapse
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .metrics import MetricsMiddleware, RequestMetrics, render_gauge
+from .ratelimit import LoadShedder, RateLimiter, SignupGuard
+from .schedule import (MINUTES_PER_DAY, ScheduleIndex, StoreTimetables, Timetables,
+                       conflicts_with, parse_day, parse_schedule, parse_time)
+from .search import SearchIndex
+from .store import MemoryStore, SQLiteStore
+
+
+@asynccontextmanager
+async def lifespan(app):
+    watcher = None
+    if ACTIVITIES_FILE_POLL_SECONDS > 0:
+        watcher = CatalogueWatcher(
+            ACTIVITIES_FILE, apply_catalogue, ACTIVITIES_FILE_POLL_SECONDS
+        ).start()
+    if relay is not None:
+        relay.start()
+    yield
+    if relay is not None:
+        relay.stop()
+    if watcher is not None:
+        watcher.stop()
+    store.close()
+
+
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Mergington High School API",
-              description="API for viewing and signing up for extracurricular activities")
+              description="API for viewing and signing up for extracurricular activities",
+              lifespan=lifespan)
 
 # Mount the static files directory
 current_dir = Path(__file__).parent
 app.mount("/static", StaticFiles(directory=os.path.join(Path(__file__).parent,
           "static")), name="static")
 
-# In-memory activity database
-activities = {
-    "Chess Club": {
-        "description": "Learn strategies and compete in chess tournaments",
-        "schedule": "Fridays, 3:30 PM - 5:00 PM",
-        "max_participants": 12,
-        "participants": ["michael@mergington.edu", "daniel@mergington.edu"]
-    },
-    "Programming Class": {
-        "description": "Learn programming fundamentals and build software projects",
-        "schedule": "Tuesdays and Thursdays, 3:30 PM - 4:30 PM",
-        "max_participants": 20,
-        "participants": ["emma@mergington.edu", "sophia@mergington.edu"]
-    },
-    "Gym Class": {
-        "description": "Physical education and sports activities",
-        "schedule": "Mondays, Wednesdays, Fridays, 2:00 PM - 3:00 PM",
-        "max_participants": 30,
-        "participants": ["john@mergington.edu", "olivia@mergington.edu"]
-    },
-    "Soccer Team": {
-        "description": "Join the school soccer team and compete in matches",
-        "schedule": "Tuesdays and Thursdays, 4:00 PM - 5:30 PM",
-        "max_participants": 22,
-        "participants": ["liam@mergington.edu", "noah@mergington.edu"]
-    },
-    "Basketball Team": {
-        "description": "Practice and play basketball with the school team",
-        "schedule": "Wednesdays and Fridays, 3:30 PM - 5:00 PM",
-        "max_participants": 15,
-        "participants": ["ava@mergington.edu", "mia@mergington.edu"]
-    },
-    "Art Club": {
-        "description": "Explore your creativity through painting and drawing",
-        "schedule": "Thursdays, 3:30 PM - 5:00 PM",
-        "max_participants": 15,
-        "participants": ["amelia@mergington.edu", "harper@mergington.edu"]
-    },
-    "Drama Club": {
-        "description": "Act, direct, and produce plays and performances",
-        "schedule": "Mondays and Wednesdays, 4:00 PM - 5:30 PM",
-        "max_participants": 20,
-        "participants": ["ella@mergington.edu", "scarlett@mergington.edu"]
-    },
-    "Math Club": {
-        "description": "Solve challenging problems and participate in math competitions",
-        "schedule": "Tuesdays, 3:30 PM - 4:30 PM",
-        "max_participants": 10,
-        "participants": ["james@mergington.edu", "benjamin@mergington.edu"]
-    },
-    "Debate Team": {
-        "description": "Develop public speaking and argumentation skills",
-        "schedule": "Fridays, 4:00 PM - 5:30 PM",
-        "max_participants": 12,
-        "participants": ["charlotte@mergington.edu", "henry@mergington.edu"]
-    }
+# The activity catalogue, loaded from a JSON file and reloaded whenever
+# the file changes; participants listed there seed new activities
+ACTIVITIES_FILE = os.environ.get("ACTIVITIES_FILE", os.path.join(current_dir, "activities.json"))
+# How often the file is checked for changes; 0 disables reloading
+ACTIVITIES_FILE_POLL_SECONDS = float(os.environ.get("ACTIVITIES_FILE_POLL_SECONDS", "2"))
+activities = load_catalogue(ACTIVITIES_FILE)
+
+
+
+# Storage backend. "memory" (the default) keeps everything in this process,
+# optionally journaled to ACTIVITIES_JOURNAL_DIR so enrollments survive a
+# restart. "sqlite" keeps it in ACTIVITIES_SQLITE_PATH, which several
+# worker processes on one box can share.
+STORE_BACKEND = os.environ.get("ACTIVITIES_STORE", "memory")
+
+
+# Number of recent changes kept for GET /activities/changes
+CHANGE_LOG_SIZE = int(os.environ.get("ACTIVITIES_CHANGE_LOG_SIZE", "1024"))
+
+# Whether signups for a full activity join its waitlist instead of failing
+WAITLISTS = os.environ.get("ACTIVITIES_WAITLISTS", "1") != "0"
+
+
+def create_store():
+    if STORE_BACKEND == "sqlite":
+        return SQLiteStore(
+            os.environ.get("ACTIVITIES_SQLITE_PATH", "activities.db"),
+            activities,
+            pool_size=int(os.environ.get("ACTIVITIES_SQLITE_POOL_SIZE", "8")),
+            change_log_size=CHANGE_LOG_SIZE,
+            waitlists=WAITLISTS,
+        )
+    if STORE_BACKEND == "memory":
+        return MemoryStore(
+            activities,
+            change_log_size=CHANGE_LOG_SIZE,
+            waitlists=WAITLISTS,
+            journal_dir=os.environ.get("ACTIVITIES_JOURNAL_DIR"),
+            flush_interval=float(os.environ.get("ACTIVITIES_JOURNAL_FLUSH_MS", "5")) / 1000,
+            compact_interval=float(os.environ.get("ACTIVITIES_JOURNAL_COMPACT_SECONDS", "300")),
+        )
+    raise ValueError(f"Unknown ACTIVITIES_STORE backend: {STORE_BACKEND!r}")
+
+
+store = create_store()
+# A persistent store may hold an older catalogue than the file
+store.update_catalogue(activities)
+
+
+
+def build_search_index(catalogue):
+    index = SearchIndex()
+    for name, details in catalogue.items():
+        index.add(name, details["description"])
+    return index
+
+
+def index_schedule(index, name, schedule):
+    try:
+        index.add(name, parse_schedule(schedule))
+    except ValueError as error:
+        index.remove(name)
+        logger.warning("Not indexing schedule of %s: %s", name, error)
+
+
+def build_schedule_index(catalogue):
+    index = ScheduleIndex()
+    for name, details in catalogue.items():
+        index_schedule(index, name, details["schedule"])
+    return index
+
+
+# Full-text index over activity names and descriptions, and an interval
+# index over their parsed weekly schedules
+_startup_catalogue = store.snapshot()[1]
+search_index = build_search_index(_startup_catalogue)
+schedule_index = build_schedule_index(_startup_catalogue)
+
+# What signup does when a student's activities would overlap: "reject" it,
+# "flag" it in the response, or "allow" it silently
+SCHEDULE_CONFLICTS = os.environ.get("ACTIVITIES_SCHEDULE_CONFLICTS", "reject")
+
+
+def _update_timetables(event):
+    if event["op"] == "signup":
+        timetables.enroll(event["email"], event["activity"])
+    elif event["op"] == "unregister":
+        timetables.drop(event["email"], event["activity"])
+
+
+def build_timetables(catalogue):
+    result = Timetables(schedule_index)
+    for name, details in catalogue.items():
+        for email in details["participants"]:
+            result.enroll(email, name)
+    return result
+
+
+# Per-student sets of enrolled sessions. This process sees every change to
+# a memory store, so they are kept in step with it; other workers write to
+# a SQLite store too, so there they are read from it on each check.
+if isinstance(store, SQLiteStore):
+    timetables = StoreTimetables(schedule_index, store)
+else:
+    timetables = build_timetables(_startup_catalogue)
+    store.add_listener(_update_timetables)
+
+
+def apply_catalogue(catalogue):
+    """Swap in an edited catalogue without a restart.
+
+    The store keeps everyone's enrollments; only the index entries of
+    activities whose description or schedule changed are rebuilt.
+    """
+    global activities
+    previous = activities
+    changes = store.update_catalogue(catalogue)
+    # With several workers another one may have updated the store already,
+    # so the indexes are diffed against this process's last catalogue
+    for name in previous.keys() - catalogue.keys():
+        search_index.remove(name)
+        schedule_index.remove(name)
+        if isinstance(timetables, Timetables):
+            timetables.remove_activity(name)
+    for name, details in catalogue.items():
+        old = previous.get(name)
+        if old is None or old["description"] != details["description"]:
+            search_index.add(name, details["description"])
+        if old is None or old["schedule"] != details["schedule"]:
+            index_schedule(schedule_index, name, details["schedule"])
+            if isinstance(timetables, Timetables):
+                activity = store.get_activity(name)
+                if schedule_index.sessions(name):
+                    for email in activity["participants"] if activity else ():
+                        timetables.enroll(email, name)
+                else:
+                    timetables.remove_activity(name)
+    activities = catalogue
+    logger.info(
+        "Reloaded %s: %d added, %d removed, %d changed", ACTIVITIES_FILE,
+        len(changes.added), len(changes.removed), len(changes.changed),
+    )
+
+
+# Striped locks so a student's conflict check and signup are atomic
+# without serializing different students. They only cover this process:
+# with several SQLite workers, two signups for one student landing on
+# different workers at once can both pass the check.
+_student_locks = [threading.Lock() for _ in range(64)]
+
+
+def student_lock(email):
+    return _student_locks[hash(email) % len(_student_locks)]
+
+
+# Operator endpoints need this token in X-Admin-Token; unset disables them
+ADMIN_TOKEN = os.environ.get("ACTIVITIES_ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    if not ADMIN_TOKEN or x_admin_token is None or not secrets.compare_digest(
+        x_admin_token.encode(), ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+# "fcfs" seats students as they sign up. "lottery" opens a window in which
+# signups only record ranked choices, until an admin runs the allocation;
+# after that signups are first come, first served again.
+ALLOCATION_MODE = os.environ.get("ACTIVITIES_ALLOCATION", "fcfs")
+LOTTERY_SEATS_PER_STUDENT = int(os.environ.get("ACTIVITIES_LOTTERY_SEATS", "1"))
+preferences = PreferenceBook(is_open=ALLOCATION_MODE == "lottery")
+last_allocation = None
+_allocation_lock = threading.Lock()
+
+# Enrollment changes are pushed to open event streams. SQLite may be
+# shared with other workers, so there the hub follows the change log rather
+# than only this process's writes
+hub = EventHub()
+CHANGES_POLL_SECONDS = float(os.environ.get("ACTIVITIES_CHANGES_POLL_SECONDS", "0.5"))
+relay = None
+if isinstance(store, SQLiteStore):
+    relay = ChangeRelay(store, hub.publish, CHANGES_POLL_SECONDS)
+else:
+    store.add_listener(hub.publish)
+SSE_HEARTBEAT_SECONDS = 15
+# Roster sockets wait this long after sending so bursts coalesce
+WS_COALESCE_SECONDS = 0.05
+
+
+def _rate(name, default):
+    """Parse "<per second>/<burst>" from an environment variable"""
+    rate, burst = os.environ.get(name, default).split("/")
+    return float(rate), float(burst)
+
+
+# Signups per second and burst allowed per client IP and per email; a rate
+# of 0 disables that limit. IPs get more room since a school shares a few.
+RATE_LIMITS = {
+    "ip": _rate("ACTIVITIES_RATE_LIMIT_IP", "20/40"),
+    "email": _rate("ACTIVITIES_RATE_LIMIT_EMAIL", "1/5"),
 }
+RATE_LIMIT_KEYS = int(os.environ.get("ACTIVITIES_RATE_LIMIT_KEYS", "100000"))
+# Requests handled at once before new ones get 503. Keep this below the
+# threadpool size (40 by default) so queued requests never pile up there.
+MAX_IN_FLIGHT = int(os.environ.get("ACTIVITIES_MAX_IN_FLIGHT", "32"))
+
+rate_limits = {kind: limit for kind, limit in RATE_LIMITS.items() if limit[0] > 0}
+app.add_middleware(
+    SignupGuard,
+    limiter=RateLimiter(rate_limits, RATE_LIMIT_KEYS) if rate_limits else None,
+    shedder=LoadShedder(MAX_IN_FLIGHT) if MAX_IN_FLIGHT > 0 else None,
+    # Event streams stay open for minutes and never touch the threadpool
+    exempt_paths=("/activities/events", "/activities/ws"),
+)
+
+# Responses to requests carrying an Idempotency-Key are replayed to retries
+# for this long. Added last so it runs first: a replay skips the limits.
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get("ACTIVITIES_IDEMPOTENCY_TTL_SECONDS", "3600"))
+IDEMPOTENCY_KEYS = int(os.environ.get("ACTIVITIES_IDEMPOTENCY_KEYS", "10000"))
+app.add_middleware(
+    IdempotencyMiddleware,
+    cache=ResponseCache(IDEMPOTENCY_KEYS, IDEMPOTENCY_TTL_SECONDS),
+)
+
+# Requests slower than this are logged with the stacks they were stuck
+# on; 0 disables the log
+SLOW_REQUEST_MS = float(os.environ.get("ACTIVITIES_SLOW_REQUEST_MS", "1000"))
+slow_requests = deque(maxlen=100)
+if SLOW_REQUEST_MS > 0:
+    app.add_middleware(
+        SlowRequestLog,
+        entries=slow_requests,
+        threshold=SLOW_REQUEST_MS / 1000,
+        exempt_paths=("/activities/events", "/admin/profile"),
+    )
+
+# Outermost, so requests answered by the middleware above are counted too
+request_metrics = RequestMetrics()
+app.add_middleware(
+    MetricsMiddleware,
+    metrics=request_metrics,
+    routes=app.router.routes,
+    exempt_paths=("/activities/events",),
+)
+
+# Fields GET /activities can return per activity; participant_count and
+# spots_left are derived, and summary mode returns them instead of the emails
+ACTIVITY_FIELDS = ("description", "schedule", "max_participants", "participants",
+                   "participant_count", "spots_left")
+SUMMARY_FIELDS = ("description", "schedule", "max_participants",
+                  "participant_count", "spots_left")
+MAX_PAGE_SIZE = 500
+# Encoded variants (page, projection) kept per catalogue version
+MAX_CACHED_BODIES = 64
+
+
+class CatalogueCache:
+    """Snapshot of the catalogue at one store version and its encoded bodies"""
+
+    def __init__(self, version, catalogue):
+        self.version = version
+        self.catalogue = catalogue
+        self.names = list(catalogue)
+        self.positions = {name: position for position, name in enumerate(self.names)}
+        # query key -> (JSON bytes, next cursor)
+        self.bodies = {}
+
+
+_catalogue_cache = CatalogueCache(None, {})
+
+
+def cached_catalogue():
+    """Return the catalogue snapshot, taking a new one only after a write"""
+    global _catalogue_cache
+    cached = _catalogue_cache
+    if cached.version != store.version:
+        cached = _catalogue_cache = CatalogueCache(*store.snapshot())
+    return cached
+
+
+def project(details, fields):
+    """Pick fields from one activity, computing the derived ones"""
+    result = {}
+    for field in fields:
+        if field == "participant_count":
+            result[field] = len(details["participants"])
+        elif field == "spots_left":
+            result[field] = details["max_participants"] - len(details["participants"])
+        else:
+            result[field] = details[field]
+    return result
+
+
+def encode_cursor(name):
+    return base64.urlsafe_b64encode(name.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        return base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_activities(cached, fields=None, cursor=None, limit=None):
+    """Return (JSON bytes, next cursor) for a page of the catalogue.
+
+    The full catalogue with default fields is the common case; every
+    variant is encoded once per version and then served from the cache.
+    """
+    key = (fields, cursor, limit)
+    hit = cached.bodies.get(key)
+    if hit is not None:
+        return hit
+
+    names = cached.names
+    start = 0
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        if after not in cached.positions:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        start = cached.positions[after] + 1
+    end = len(names) if limit is None else min(start + limit, len(names))
+    page = names[start:end]
+
+    if fields is None and start == 0 and end == len(names):
+        data = cached.catalogue
+    else:
+        selected = fields or ACTIVITY_FIELDS[:4]
+        data = {name: project(cached.catalogue[name], selected) for name in page}
+    next_cursor = encode_cursor(page[-1]) if page and end < len(names) else None
+
+    result = (dumps(data), next_cursor)
+    if len(cached.bodies) < MAX_CACHED_BODIES:
+        cached.bodies[key] = result
+    return result
+
+
+def etag_for(version):
+    return f'"{store.instance_id}-{version}"'
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match uses weak comparison, so W/"..." matches too"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
 
 
 @app.get("/")
@@ -84,49 +422,664 @@ def root():
 
 
 @app.get("/activities")
-def get_activities():
-    return activities
+def get_activities(
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+    summary: bool = False,
+):
+    """Get activities, optionally paginated and projected.
+
+    - limit/cursor: page through activities in catalogue order; the cursor
+      for the next page comes back in the X-Next-Cursor header
+    - fields: comma-separated subset of ACTIVITY_FIELDS to return
+    - summary: return participant_count and spots_left instead of the
+      participant emails
+    """
+    selected = None
+    if fields is not None:
+        selected = tuple(field.strip() for field in fields.split(",") if field.strip())
+        unknown = [field for field in selected if field not in ACTIVITY_FIELDS]
+        if unknown or not selected:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields requested"
+            )
+    if summary:
+        if selected is not None and "participants" in selected:
+            raise HTTPException(
+                status_code=400,
+                detail="participants is not available in summary mode"
+            )
+        selected = selected or SUMMARY_FIELDS
+
+    # Check the ETag before doing any work, so unchanged refetches are free
+    etag = etag_for(store.version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    cached = cached_catalogue()
+    body, next_cursor = encode_activities(cached, selected, cursor, limit)
+    headers["ETag"] = etag_for(cached.version)
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class SearchResult(BaseModel):
+    activity: str
+    score: float
+
+
+class SearchResults(BaseModel):
+    results: list[SearchResult]
+
+
+@app.get("/activities/search", response_model=SearchResults)
+def search_activities(q: str, limit: int = Query(20, ge=1, le=100)):
+    """Search activity names and descriptions; every word may be a prefix"""
+    return {
+        "results": [
+            {"activity": name, "score": round(score, 4)}
+            for name, score in search_index.search(q, limit)
+        ]
+    }
+
+
+def _parse_query(parser, value):
+    try:
+        return parser(value)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+
+class SessionMatch(BaseModel):
+    activity: str
+    day: str
+    start: str
+    end: str
+
+
+class SessionMatches(BaseModel):
+    results: list[SessionMatch]
+
+
+@app.get("/activities/schedule", response_model=SessionMatches)
+def activities_by_schedule(
+    day: str,
+    after: str | None = None,
+    before: str | None = None,
+    at: str | None = None,
+):
+    """Find activity sessions on a day.
+
+    - at: sessions in progress at that time, e.g. at=4:15 PM
+    - after/before: sessions starting in [after, before), e.g. after=4 PM
+    """
+    day_start = _parse_query(parse_day, day) * MINUTES_PER_DAY
+    if at is not None:
+        moment = day_start + _parse_query(parse_time, at)
+        matches = schedule_index.overlapping(moment, moment + 1)
+    else:
+        start = _parse_query(parse_time, after) if after else 0
+        end = _parse_query(parse_time, before) if before else MINUTES_PER_DAY
+        matches = schedule_index.starting_between(day_start + start, day_start + end)
+
+    return {
+        "results": [{"activity": name, **session.to_dict()} for name, session in matches]
+    }
+
+
+class ChangeEvent(BaseModel):
+    activity: str
+    email: str | None
+    op: str
+    remaining_spots: int
+    version: int
+    # Only sent for signups that came off the waitlist
+    promoted: bool = False
+
+
+class ChangesResponse(BaseModel):
+    instance_id: str
+    version: int
+    resync: bool
+    changes: list[ChangeEvent]
+
+
+@app.get("/activities/changes", response_model=ChangesResponse,
+         response_model_exclude_unset=True)
+def get_activity_changes(since: int):
+    """Return the enrollment changes made after version `since`.
+
+    Versions come from the ETag of GET /activities or from earlier calls.
+    Only recent changes are kept; when `since` is outside that window the
+    response has resync set and the client should refetch GET /activities.
+    """
+    version, changes = store.changes_since(since)
+    return {
+        "instance_id": store.instance_id,
+        "version": version,
+        "resync": changes is None,
+        "changes": changes or [],
+    }
+
+
+@app.get("/activities/events")
+async def activity_events(request: Request):
+    """Stream enrollment changes as Server-Sent Events.
+
+    Each "enrollment" event carries {activity, email, op, remaining_spots,
+    version}. A "resync" event means the client fell behind and should
+    refetch GET /activities.
+    """
+    subscription = hub.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = await subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                elif event["op"] == "resync":
+                    yield "event: resync\ndata: {}\n\n"
+                else:
+                    data = dumps(event).decode("utf-8")
+                    yield f"id: {event['version']}\nevent: enrollment\ndata: {data}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _is_name_list(value):
+    return isinstance(value, list) and all(isinstance(name, str) for name in value)
+
+
+@app.websocket("/activities/ws")
+async def activity_roster_socket(websocket: WebSocket):
+    """Live rosters for the activities a client subscribes to.
+
+    Clients send {"subscribe": [names]} or {"unsubscribe": [names]}. Each
+    newly subscribed activity gets a "roster" message with its full
+    participant list and the store version it was read at, then "changes"
+    messages mapping emails to "signup" or "unregister". Changes whose
+    version is not above the roster's are already part of it. Changes are
+    coalesced while the client is slow to read, so a backed-up socket never
+    queues more than one batch per activity. A malformed message gets an "error" message back.
+    """
+    await websocket.accept()
+    subscription = hub.add(RosterSubscription(hub))
+
+    async def send_json(message):
+        await websocket.send_text(dumps(message).decode("utf-8"))
+
+    async def receive():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            try:
+                request = json.loads(message.get("text") or message.get("bytes") or "")
+            except ValueError:
+                await send_json({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            subscribe = unsubscribe = None
+            if isinstance(request, dict):
+                subscribe = request.get("subscribe") or []
+                unsubscribe = request.get("unsubscribe") or []
+            if not (_is_name_list(subscribe) and _is_name_list(unsubscribe)):
+                await send_json({
+                    "type": "error",
+                    "detail": "Send {\"subscribe\": [names]} or {\"unsubscribe\": [names]}",
+                })
+                continue
+            subscription.subscribe(subscribe)
+            subscription.unsubscribe(unsubscribe)
+
+    async def send():
+        while True:
+            snapshots, changes = await subscription.drain()
+            for name in snapshots:
+                version, activity = await run_in_threadpool(store.activity_snapshot, name)
+                if activity is None:
+                    subscription.unsubscribe([name])
+                    await send_json(
+                        {"type": "error", "activity": name, "detail": "Activity not found"}
+                    )
+                    continue
+                await send_json({
+                    "type": "roster",
+                    "activity": name,
+                    "participants": activity["participants"],
+                    "remaining_spots": activity["max_participants"] - len(activity["participants"]),
+                    "version": version,
+                })
+            for name, pending in changes.items():
+                if not pending["changes"]:
+                    continue
+                await send_json({"type": "changes", "activity": name, **pending})
+            await asyncio.sleep(WS_COALESCE_SECONDS)
+
+    tasks = [asyncio.ensure_future(receive()), asyncio.ensure_future(send())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not isinstance(task.exception(), WebSocketDisconnect):
+                task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        subscription.close()
 
 
 @app.post("/activities/{activity_name}/signup")
-def signup_for_activity(activity_name: str, email: str):
-    """Sign up a student for an activity"""
+def signup_for_activity(activity_name: str, email: str, response: Response):
+    """Sign up a student for an activity, or put them on its waitlist if it
+    is full. While a lottery is open, record it as the student's next choice."""
+    if preferences.is_open:
+        result = record_preference(activity_name, email, response)
+        if result is not None:
+            return result
+
+    with student_lock(email):
+        conflicts = []
+        if SCHEDULE_CONFLICTS != "allow":
+            # A waitlisted student can be promoted at any time, so the
+            # activities they wait for count as well as those they are in
+            conflicts = sorted({
+                *timetables.conflicts_with(email, activity_name),
+                *conflicts_with(schedule_index, store.student_waitlists(email), activity_name),
+            })
+
+        # Validate the activity does not clash with the student's others
+        if conflicts and SCHEDULE_CONFLICTS == "reject":
+            raise HTTPException(
+                status_code=400,
+                detail=f"Schedule conflicts with {', '.join(conflicts)}"
+            )
+
+        # The store checks and adds atomically so concurrent signups cannot overfill
+        status = store.add_participant(activity_name, email)
+
     # Validate activity exists
-    if activity_name not in activities:
+    if status == "unknown_activity":
         raise HTTPException(status_code=404, detail="Activity not found")
 
-    # Get the specific activity
-    activity = activities[activity_name]
-
     # Validate student is not already signed up
-    if email in activity["participants"]:
+    if status == "duplicate":
         raise HTTPException(
             status_code=400,
             detail="Student is already signed up"
         )
 
-    # Add student
-    activity["participants"].append(email)
-    return {"message": f"Signed up {email} for {activity_name}"}
+    # Validate there was a seat left
+    if status == "full":
+        raise HTTPException(
+            status_code=400,
+            detail="Activity is full"
+        )
+
+    if status == "waitlisted":
+        # Accepted, but the seat is only promised once one frees up
+        response.status_code = 202
+        position = store.waitlist_position(activity_name, email)
+        result = {
+            "message": f"Added {email} to the waitlist for {activity_name}",
+            "waitlist_position": position,
+        }
+    else:
+        result = {"message": f"Signed up {email} for {activity_name}"}
+    if conflicts:
+        result["conflicts"] = conflicts
+    return result
+
+
+def record_preference(activity_name, email, response):
+    """Record a signup as the student's next choice; returns None if the
+    lottery closed meanwhile, and the signup should go ahead as usual"""
+    if not store.has_activity(activity_name):
+        raise HTTPException(status_code=404, detail="Activity not found")
+    if activity_name in store.student_activities(email):
+        raise HTTPException(status_code=400, detail="Student is already signed up")
+
+    try:
+        rank = preferences.add(email, activity_name)
+    except LotteryClosed:
+        return None
+    if rank is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Activity is already one of the student's choices"
+        )
+    response.status_code = 202
+    return {
+        "message": f"Recorded {activity_name} as choice {rank} for {email}",
+        "choice": rank,
+    }
+
+
+class BatchSignupItem(BaseModel):
+    activity: str
+    email: str
+
+
+class BatchSignupRequest(BaseModel):
+    signups: list[BatchSignupItem]
+
+
+def batch_preference(activity_name, email):
+    """Record one batch item as a choice and return its status, or None if
+    the lottery has closed"""
+    if not store.has_activity(activity_name):
+        return "unknown_activity"
+    if activity_name in store.student_activities(email):
+        return "duplicate"
+    try:
+        rank = preferences.add(email, activity_name)
+    except LotteryClosed:
+        return None
+    return "duplicate" if rank is None else "recorded"
+
+
+@app.post("/activities/batch-signup")
+def batch_signup(batch: BatchSignupRequest):
+    """Sign up many students in one request.
+
+    Items are grouped by activity so each activity is written once.
+    Schedule conflicts are not checked; GET /students/{email}/conflicts
+    reports any an import created.
+    Returns one result per item, in request order, with a status of
+    "enrolled", "waitlisted", "duplicate", "full" or "unknown_activity".
+    While a lottery is open, items are recorded as choices instead, in
+    order, with a status of "recorded".
+    """
+    statuses = [None] * len(batch.signups)
+    if preferences.is_open:
+        for position, item in enumerate(batch.signups):
+            status = batch_preference(item.activity, item.email)
+            if status is None:
+                # The lottery closed meanwhile; sign the rest up as usual
+                break
+            statuses[position] = status
+
+    by_activity = {}
+    for position, item in enumerate(batch.signups):
+        if statuses[position] is None:
+            by_activity.setdefault(item.activity, []).append(position)
+
+    for activity_name, positions in by_activity.items():
+        emails = [batch.signups[position].email for position in positions]
+        for position, status in zip(positions, store.add_participants(activity_name, emails)):
+            statuses[position] = status
+
+    return {
+        "results": [
+            {"activity": item.activity, "email": item.email, "status": status}
+            for item, status in zip(batch.signups, statuses)
+        ]
+    }
 
 
 @app.delete("/activities/{activity_name}/unregister")
 def unregister_from_activity(activity_name: str, email: str):
-    """Unregister a student from an activity"""
+    """Unregister a student from an activity or take them off its waitlist.
+
+    A freed seat goes to the first student on the waitlist, who receives a
+    signup event with "promoted": true.
+    """
+    if preferences.remove(email, activity_name):
+        return {"message": f"Removed {activity_name} from the choices of {email}"}
+
+    status = store.remove_participant(activity_name, email)
+
     # Validate activity exists
-    if activity_name not in activities:
+    if status == "unknown_activity":
         raise HTTPException(status_code=404, detail="Activity not found")
 
-    # Get the specific activity
-    activity = activities[activity_name]
-
     # Validate student is signed up
-    if email not in activity["participants"]:
+    if status == "not_enrolled":
         raise HTTPException(
             status_code=400,
             detail="Student is not signed up for this activity"
         )
 
-    # Remove student
-    activity["participants"].remove(email)
+    if status == "left_waitlist":
+        return {"message": f"Removed {email} from the waitlist for {activity_name}"}
     return {"message": f"Unregistered {email} from {activity_name}"}
+
+
+@app.get("/activities/{activity_name}/waitlist")
+def get_waitlist(activity_name: str, email: str | None = None):
+    """List the students waiting for an activity in order, or with `email`,
+    that student's place in line"""
+    if email is None:
+        waitlist = store.waitlist(activity_name)
+        if waitlist is None:
+            raise HTTPException(status_code=404, detail="Activity not found")
+        # Waitlists can be long; encode the list without jsonable_encoder
+        return FastJSONResponse({"activity": activity_name, "waitlist": waitlist})
+
+    position = store.waitlist_position(activity_name, email)
+    if position is None:
+        if not store.has_activity(activity_name):
+            raise HTTPException(status_code=404, detail="Activity not found")
+        raise HTTPException(status_code=404, detail="Student is not on the waitlist")
+    return {"activity": activity_name, "email": email, "position": position}
+
+
+@app.get("/students/{email}/activities", response_model=list[str])
+def get_student_activities(email: str):
+    """List the activities a student is signed up for"""
+    return store.student_activities(email)
+
+
+class Conflict(BaseModel):
+    activities: list[str]
+    day: str
+    start: str
+    end: str
+
+
+class Conflicts(BaseModel):
+    conflicts: list[Conflict]
+
+
+@app.get("/students/{email}/conflicts", response_model=Conflicts)
+def get_student_conflicts(email: str):
+    """List pairs of a student's activities whose sessions overlap"""
+    return {
+        "conflicts": [
+            {"activities": [name, other], **overlap.to_dict()}
+            for name, other, overlap in timetables.conflicts(email)
+        ]
+    }
+
+
+class PreferencesRequest(BaseModel):
+    choices: list[str]
+
+
+@app.get("/students/{email}/preferences")
+def get_student_preferences(email: str):
+    """A student's ranked lottery choices, best first"""
+    return {"email": email, "choices": preferences.choices(email)}
+
+
+@app.put("/students/{email}/preferences")
+def set_student_preferences(email: str, request: PreferencesRequest):
+    """Replace a student's ranked lottery choices"""
+    if not preferences.is_open:
+        raise HTTPException(status_code=400, detail="The lottery is not open")
+    unknown = [name for name in request.choices if not store.has_activity(name)]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Activity not found: {', '.join(unknown)}")
+    try:
+        preferences.set(email, request.choices)
+    except LotteryClosed:
+        raise HTTPException(status_code=400, detail="The lottery is not open")
+    return {"email": email, "choices": preferences.choices(email)}
+
+
+class AllocationRequest(BaseModel):
+    seed: int | None = None
+    # Students with a higher weight tend to draw earlier; the default is 1
+    weights: dict[str, PositiveFloat] | None = None
+
+
+class AllocationReport(BaseModel):
+    seed: int
+    allocated: int
+    unassigned: list[str]
+    ranks: dict[int, int]
+    assignments: dict[str, list[str]]
+
+
+class AllocationStatus(BaseModel):
+    mode: str
+    open: bool
+    students: int
+    last: AllocationReport | None
+
+
+def allocation_report(allocation):
+    return {
+        "seed": allocation.seed,
+        "allocated": sum(len(emails) for emails in allocation.assignments.values()),
+        "unassigned": allocation.unassigned,
+        "ranks": allocation.ranks,
+        "assignments": allocation.assignments,
+    }
+
+
+@app.get("/allocation", response_model=AllocationStatus)
+def get_allocation():
+    """Lottery status and the result of the last allocation"""
+    return {
+        "mode": ALLOCATION_MODE,
+        "open": preferences.is_open,
+        "students": len(preferences),
+        "last": allocation_report(last_allocation) if last_allocation else None,
+    }
+
+
+@app.post("/allocation/run", response_model=AllocationReport,
+          dependencies=[Depends(require_admin)])
+def run_allocation(request: AllocationRequest | None = None):
+    """Close the lottery window and seat students by lottery.
+
+    The seed is returned and kept, so the same preferences and seed
+    reproduce the allocation exactly.
+    """
+    global last_allocation
+    request = request or AllocationRequest()
+    with _allocation_lock:
+        # Closing hands over every accepted choice and refuses later ones
+        ranked_choices = preferences.close()
+        if ranked_choices is None:
+            raise HTTPException(status_code=400, detail="The lottery is not open")
+        try:
+            seed = request.seed if request.seed is not None else secrets.randbits(63)
+            _, catalogue = store.snapshot()
+            capacities = {
+                name: details["max_participants"] - len(details["participants"])
+                for name, details in catalogue.items()
+            }
+            # Students keep seats they already have, so drop those choices
+            choices = {}
+            for email, ranked in ranked_choices.items():
+                enrolled = set(store.student_activities(email))
+                choices[email] = [name for name in ranked if name not in enrolled]
+
+            allocation = allocate(choices, capacities, seed, request.weights,
+                                  LOTTERY_SEATS_PER_STUDENT)
+        except Exception:
+            # Reopen so the preferences are not stranded
+            preferences.reopen(ranked_choices)
+            raise
+        # Report only the seats the store actually gave out. A winner whose
+        # seat was taken meanwhile stays unassigned rather than waiting
+        seated = {}
+        for name, emails in allocation.assignments.items():
+            statuses = []
+            if emails:
+                statuses = store.add_participants(name, emails, join_waitlist=False)
+            seated[name] = [
+                email for email, status in zip(emails, statuses) if status == "enrolled"
+            ]
+        allocation = confirm(allocation, choices, seated)
+        last_allocation = allocation
+    return allocation_report(allocation)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Request and store metrics in the Prometheus text format"""
+    cached = cached_catalogue()
+    seats_left = [
+        ({"activity": name}, details["max_participants"] - len(details["participants"]))
+        for name, details in cached.catalogue.items()
+    ]
+    body = "".join((
+        request_metrics.render(),
+        render_gauge("activities", "Activities in the catalogue.",
+                     [({}, len(cached.catalogue))]),
+        render_gauge("activities_enrollments", "Students enrolled, summed over activities.",
+                     [({}, sum(len(details["participants"])
+                               for details in cached.catalogue.values()))]),
+        render_gauge("activities_seats_left", "Free seats per activity.", seats_left),
+        render_gauge("activities_store_version", "Store version counter.",
+                     [({}, cached.version)]),
+        render_gauge("activities_event_subscribers", "Open event streams in this process.",
+                     [({}, hub.subscriber_count)]),
+    ))
+    return Response(body, media_type=METRICS_CONTENT_TYPE)
+
+
+MAX_PROFILE_SECONDS = 60
+_profile_lock = threading.Lock()
+
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    all_threads: bool = False,
+):
+    """Sample every thread's stack for `seconds` and return collapsed stacks.
+
+    Only stacks through the application are kept unless `all_threads` is
+    set. The output can be fed to flamegraph.pl or speedscope as is.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        sampler = Sampler(interval_ms / 1000, None if all_threads else APP_ROOT).start()
+        try:
+            # Sleep on the event loop so profiling holds no threadpool thread
+            await asyncio.sleep(seconds)
+        finally:
+            counts = sampler.stop()
+    finally:
+        _profile_lock.release()
+    return Response(
+        collapse(counts),
+        media_type="text/plain",
+        headers={"X-Profile-Samples": str(sampler.samples)},
+    )
+
+
+@app.get("/admin/slow-requests", dependencies=[Depends(require_admin)])
+def get_slow_requests():
+    """The most recent requests slower than ACTIVITIES_SLOW_REQUEST_MS"""
+    return {"threshold_ms": SLOW_REQUEST_MS, "requests": list(slow_requests)}
@@ -0,0 +1,106 @@
+"""
+Activity catalogue file: loading, validation and change detection.
+
+The catalogue lives in a JSON file mapping activity names to their
+description, schedule, max_participants and seed participants. It is
+parsed once at startup. CatalogueWatcher then checks the file's stat
+signature (mtime, size, inode) every few seconds on a background thread, a
+single stat() call, and only rereads and reparses the file when that
+changes. Requests never touch the file.
+
+A file that fails to parse or validate is logged and ignored, so a
+half-saved edit leaves the running catalogue alone until the file is valid
+again.
+"""
+
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def parse_catalogue(data):
+    """Validate decoded JSON and return {name: details} with participants
+    as a list; raises ValueError describing the first problem"""
+    if not isinstance(data, dict):
+        raise ValueError("Catalogue must be an object mapping activity names to details")
+    catalogue = {}
+    for name, details in data.items():
+        if not isinstance(details, dict):
+            raise ValueError(f"{name}: details must be an object")
+        for field in ("description", "schedule"):
+            if not isinstance(details.get(field), str):
+                raise ValueError(f"{name}: {field} must be a string")
+        max_participants = details.get("max_participants")
+        if (not isinstance(max_participants, int) or isinstance(max_participants, bool)
+                or max_participants < 0):
+            raise ValueError(f"{name}: max_participants must be a non-negative integer")
+        participants = details.get("participants", [])
+        if not isinstance(participants, list) or not all(isinstance(email, str) for email in participants):
+            raise ValueError(f"{name}: participants must be a list of emails")
+        catalogue[name] = {
+            "description": details["description"],
+            "schedule": details["schedule"],
+            "max_participants": max_participants,
+            "participants": list(dict.fromkeys(participants)),
+        }
+    return catalogue
+
+
+def load_catalogue(path):
+    """Read and validate a catalogue file; raises OSError or ValueError"""
+    with open(path, "r", encoding="utf-8") as handle:
+        return parse_catalogue(json.load(handle))
+
+
+def file_signature(path):
+    """Return what changes whenever the file is rewritten, or None if missing"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class CatalogueWatcher:
+    """Polls a catalogue file and calls on_change(catalogue) after each valid edit"""
+
+    def __init__(self, path, on_change, interval=2.0):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._signature = file_signature(path)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="catalogue-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def check(self):
+        """Reload if the file changed since the last check; returns whether
+        a new catalogue was applied"""
+        signature = file_signature(self.path)
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        try:
+            catalogue = load_catalogue(self.path)
+        except (OSError, ValueError) as error:
+            logger.warning("Keeping the current catalogue; %s is invalid: %s", self.path, error)
+            return False
+        self.on_change(catalogue)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Reloading %s failed", self.path)
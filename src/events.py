@@ -0,0 +1,217 @@
+"""
+In-process broadcast hub for enrollment change events.
+
+The store publishes events from whichever threadpool thread handled the
+write; subscribers are asyncio queues consumed by streaming endpoints. A
+publish costs one call_soon_threadsafe per event loop, however many
+subscribers that loop has, so writers holding an activity lock are never
+slowed down by the number of open streams.
+
+A subscriber that falls more than its queue size behind is not allowed to
+hold the publisher back: its queue is cleared and it receives a single
+"resync" event telling it to refetch the catalogue. RosterSubscription
+instead coalesces a burst into one batch of changes per activity, so its
+memory is bounded by roster sizes rather than by how far behind it is.
+
+Store listeners only see writes made in this process. When several workers
+share a SQLite database, ChangeRelay feeds the hub from the store's change
+log instead, so every worker's streams carry every worker's changes, in
+version order.
+"""
+
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+RESYNC = {"op": "resync"}
+
+
+class Subscription:
+    """Queue of events for one consumer"""
+
+    def __init__(self, hub, loop, maxsize):
+        self._hub = hub
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, event):
+        """Queue an event; runs on the subscriber's event loop"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self, timeout=None):
+        """Return the next event, or None if none arrives within timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self._hub.unsubscribe(self)
+
+
+class EventHub:
+    """Fans events out from any thread to asyncio subscribers"""
+
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        # event loop -> subscriptions consuming on that loop
+        self._subscribers = {}
+
+    def subscribe(self):
+        """Register a queue subscription on the running event loop"""
+        return self.add(Subscription(self, asyncio.get_running_loop(), self.queue_size))
+
+    def add(self, subscription):
+        """Register any object with a loop attribute and a deliver(event) method"""
+        loop = subscription.loop
+        with self._lock:
+            # Copy on write so publish() can iterate without the lock
+            subscribers = dict(self._subscribers)
+            subscribers[loop] = subscribers.get(loop, frozenset()) | {subscription}
+            self._subscribers = subscribers
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = dict(self._subscribers)
+            remaining = subscribers.get(subscription.loop, frozenset()) - {subscription}
+            if remaining:
+                subscribers[subscription.loop] = remaining
+            else:
+                subscribers.pop(subscription.loop, None)
+            self._subscribers = subscribers
+
+    def publish(self, event):
+        """Deliver an event to every subscriber; safe to call from any thread"""
+        for loop, subscriptions in self._subscribers.items():
+            try:
+                loop.call_soon_threadsafe(_fan_out, subscriptions, event)
+            except RuntimeError:
+                # The loop has been closed; its subscribers are gone
+                pass
+
+    @property
+    def subscriber_count(self):
+        return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+
+class RosterSubscription:
+    """Per-activity change feed that coalesces bursts.
+
+    Only events for subscribed activities are kept. Until the consumer
+    drains them, changes are merged per email: a signup followed by an
+    unregister cancels out, and only the latest remaining_spots and version
+    are kept per activity.
+    """
+
+    def __init__(self, hub):
+        self._hub = hub
+        self.loop = asyncio.get_running_loop()
+        self.activities = set()
+        self._changes = {}
+        self._snapshots = set()
+        self._ready = asyncio.Event()
+
+    def subscribe(self, names):
+        """Follow activities; each one gets a fresh roster on the next drain"""
+        for name in names:
+            self.activities.add(name)
+            self._changes.pop(name, None)
+            self._snapshots.add(name)
+        self._ready.set()
+
+    def unsubscribe(self, names):
+        for name in names:
+            self.activities.discard(name)
+            self._changes.pop(name, None)
+            self._snapshots.discard(name)
+
+    def deliver(self, event):
+        if event["op"] == "resync":
+            # Changes were missed; resend every roster whole
+            self._changes.clear()
+            self._snapshots.update(self.activities)
+            self._ready.set()
+            return
+        name = event.get("activity")
+        if name not in self.activities:
+            return
+        if event["op"] == "catalogue":
+            # The activity itself changed; resend it whole
+            self._changes.pop(name, None)
+            self._snapshots.add(name)
+            self._ready.set()
+            return
+        pending = self._changes.setdefault(name, {"changes": {}})
+        changes = pending["changes"]
+        previous = changes.pop(event["email"], None)
+        if not (previous == "signup" and event["op"] == "unregister"):
+            changes[event["email"]] = event["op"]
+        # Keep the newest counts even if events were delivered out of order
+        if event["version"] > pending.get("version", 0):
+            pending["remaining_spots"] = event["remaining_spots"]
+            pending["version"] = event["version"]
+        self._ready.set()
+
+    async def drain(self):
+        """Wait for work, then return (activities needing a full roster,
+        {activity: coalesced changes})"""
+        await self._ready.wait()
+        self._ready.clear()
+        snapshots, self._snapshots = self._snapshots, set()
+        changes, self._changes = self._changes, {}
+        return snapshots, changes
+
+    def close(self):
+        self._hub.unsubscribe(self)
+
+
+class ChangeRelay:
+    """Polls store.changes_since() on a background thread and publishes
+    each new change, or a resync when the log no longer reaches back"""
+
+    def __init__(self, store, publish, interval=0.5):
+        self.store = store
+        self.publish = publish
+        self.interval = interval
+        self.version = store.version
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="change-relay", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def poll(self):
+        """Publish the changes logged since the last poll"""
+        version, changes = self.store.changes_since(self.version)
+        if changes is None:
+            self.publish(RESYNC)
+        else:
+            for event in changes:
+                self.publish(event)
+        self.version = version
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Relaying store changes failed")
+
+
+def _fan_out(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.deliver(event)
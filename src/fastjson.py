@@ -0,0 +1,69 @@
+"""
+Fast JSON encoding for API responses.
+
+FastAPI runs every plain value a route returns through jsonable_encoder,
+which walks and copies the whole structure in Python before json.dumps
+walks it again. For the nested dicts of lists this API returns, that copy
+costs several times more than the encoding itself. There are two ways
+around it here:
+
+- Routes with a fixed shape declare a response_model. FastAPI then has
+  pydantic validate the value and serialize it straight to JSON bytes.
+  It only does so while the route keeps FastAPI's default response class,
+  which is why FastJSONResponse is not made the app-wide default.
+- Routes returning free-form data encode it with dumps(), either into a
+  cached body or by returning a FastJSONResponse, which FastAPI passes
+  through untouched.
+
+dumps() encodes straight to UTF-8 bytes with orjson when it is installed,
+and with the standard library otherwise, producing the same compact JSON
+either way.
+"""
+
+import json
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(value):
+    """Encode the types the serializers do not handle natively"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def stdlib_dumps(data):
+    """Compact UTF-8 JSON via the standard library"""
+    return json.dumps(
+        data,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_default,
+    ).encode("utf-8")
+
+
+if orjson is not None:
+    def dumps(data):
+        """Compact UTF-8 JSON bytes"""
+        # Non-string keys (lottery ranks) are stringified, as json.dumps does
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    dumps = stdlib_dumps
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with dumps()"""
+
+    def render(self, content):
+        return dumps(content)
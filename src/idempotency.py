@@ -0,0 +1,202 @@
+"""
+Idempotency-Key support for mutating requests.
+
+A client that retries a signup after a network error cannot tell whether
+the first attempt landed: the retry comes back "already signed up". With an
+Idempotency-Key header, the first response for a key is stored and every
+retry with the same key gets that response again, with an
+Idempotent-Replayed header, without reaching the route or the store. A
+retry that arrives while the first attempt is still running waits for it.
+
+Keys are remembered in a ResponseCache of bounded size for a fixed TTL.
+Entries are kept in the order they were created, and they all live equally
+long, so the oldest entry is always at the front. That makes expiry and
+eviction a popleft. Reusing a key for a different request is an error
+rather than a replay. Transient failures (429, 503 and 5xx) are not stored,
+so retrying them runs the request again.
+
+Only signups and unregisters are covered. A replay never reaches the
+route, so it would skip the route's checks, such as the admin token;
+those are the requests clients retry, and they need none.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+MAX_KEY_LENGTH = 255
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "expires", "response", "done")
+
+    def __init__(self, fingerprint, expires):
+        self.fingerprint = fingerprint
+        self.expires = expires
+        # (status, headers, body) once the first attempt has finished
+        self.response = None
+        self.done = asyncio.Event()
+
+
+class ResponseCache:
+    """Responses by idempotency key, bounded in count and age.
+
+    Used only from the event loop, so it needs no locking.
+    """
+
+    def __init__(self, max_entries=10_000, ttl=3600.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        self._expire()
+        return self._entries.get(key)
+
+    def start(self, key, fingerprint):
+        """Claim a key for a request about to run"""
+        self._expire()
+        while len(self._entries) >= self.max_entries:
+            self._entries.popitem(last=False)
+        entry = self._entries[key] = _Entry(fingerprint, self._clock() + self.ttl)
+        return entry
+
+    def discard(self, key, entry):
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def _expire(self):
+        now = self._clock()
+        entries = self._entries
+        while entries:
+            oldest = next(iter(entries.values()))
+            if oldest.expires > now:
+                return
+            entries.popitem(last=False)
+
+
+def is_enrollment_change(method, path):
+    """Signup, batch signup and unregister requests"""
+    if not path.startswith("/activities/"):
+        return False
+    if method == "POST":
+        return path.endswith("/signup") or path == "/activities/batch-signup"
+    return method == "DELETE" and path.endswith("/unregister")
+
+
+def _cacheable(status):
+    return status < 500 and status != 429
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware replaying stored responses for repeated Idempotency-Keys"""
+
+    def __init__(self, app, cache, applies=is_enrollment_change):
+        self.app = app
+        self.cache = cache
+        # applies(method, path) picks the requests that may be replayed
+        self.applies = applies
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.applies(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        key = None
+        for name, value in scope["headers"]:
+            if name == b"idempotency-key":
+                key = value.decode("latin-1")
+                break
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await _respond(send, 400, "Invalid Idempotency-Key")
+            return
+
+        body, receive = await _buffer(receive)
+        fingerprint = hashlib.sha256(b"\0".join((
+            scope["method"].encode(), scope["path"].encode(),
+            scope.get("query_string", b""), body,
+        ))).digest()
+
+        while True:
+            entry = self.cache.get(key)
+            if entry is None:
+                break
+            if entry.fingerprint != fingerprint:
+                await _respond(send, 422, "Idempotency-Key was used for a different request")
+                return
+            if entry.response is not None:
+                status, headers, response_body = entry.response
+                await send({
+                    "type": "http.response.start",
+                    "status": status,
+                    "headers": [*headers, (b"idempotent-replayed", b"true")],
+                })
+                await send({"type": "http.response.body", "body": response_body})
+                return
+            # The first attempt is still running; its result decides ours
+            await entry.done.wait()
+
+        entry = self.cache.start(key, fingerprint)
+        start = None
+        chunks = []
+
+        async def capture(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            if start is not None and _cacheable(start["status"]):
+                entry.response = (start["status"], list(start.get("headers", ())), b"".join(chunks))
+            else:
+                self.cache.discard(key, entry)
+            entry.done.set()
+
+
+async def _buffer(receive):
+    """Read the whole request body and return it with a receive that replays it"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    body = b"".join(chunks)
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+async def _respond(send, status, detail):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
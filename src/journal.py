@@ -0,0 +1,180 @@
+"""
+Append-only write-ahead journal for the in-memory activity store.
+
+Signups, unregisters and waitlist changes are appended as JSON lines and made durable by a
+background thread that writes and fsyncs everything queued since its last
+pass in one go (group commit). Callers append while holding their activity
+lock, which is cheap, and wait for durability after releasing it, so write
+latency is bounded by the flush interval rather than by the number of
+concurrent writers.
+
+Compaction rotates the journal, writes a snapshot of every roster and
+waitlist and then drops the rotated file. On startup the snapshot is loaded
+and any journal records newer than it are replayed. Replaying a record is
+idempotent, so records that the snapshot already reflects are harmless.
+"""
+
+import json
+import os
+import threading
+import time
+
+SNAPSHOT_FILE = "snapshot.json"
+JOURNAL_FILE = "journal.log"
+ROTATED_FILE = "journal.log.1"
+
+
+def _read_records(path):
+    """Yield journal records, stopping at a torn final line"""
+    try:
+        handle = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with handle:
+        for line in handle:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Only the last line can be partial after a crash
+                return
+
+
+def load(directory):
+    """Return (state, records, last_seq) to restore: the state saved in the
+    snapshot, the journal records written after it, and the highest
+    sequence number seen"""
+    snapshot_seq = 0
+    state = {}
+    try:
+        with open(os.path.join(directory, SNAPSHOT_FILE), "r", encoding="utf-8") as handle:
+            state = json.load(handle)
+        snapshot_seq = state.pop("seq")
+    except FileNotFoundError:
+        pass
+
+    records = []
+    # A rotated file only survives if we crashed mid-compaction
+    for name in (ROTATED_FILE, JOURNAL_FILE):
+        for record in _read_records(os.path.join(directory, name)):
+            if record["seq"] > snapshot_seq:
+                records.append(record)
+    records.sort(key=lambda record: record["seq"])
+    last_seq = records[-1]["seq"] if records else snapshot_seq
+    return state, records, last_seq
+
+
+class Journal:
+    """Group-committed append-only log of store mutations"""
+
+    def __init__(self, directory, snapshot, flush_interval=0.005,
+                 compact_interval=300.0, start_seq=0):
+        """snapshot is a callable returning a JSON-serializable dict of the
+        whole store state, written out on compaction"""
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self._snapshot = snapshot
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._durable = threading.Condition(self._lock)
+        self._pending = []
+        self._seq = start_seq
+        self._durable_seq = start_seq
+        self._closed = False
+        self._file = open(os.path.join(directory, JOURNAL_FILE), "a", encoding="utf-8")
+        self._last_compaction = time.monotonic()
+
+        # Left over from a crash mid-compaction. The caller has already
+        # restored its records, so snapshot now before a later rotation
+        # could overwrite it.
+        rotated_path = os.path.join(directory, ROTATED_FILE)
+        if os.path.exists(rotated_path):
+            self._write_snapshot(start_seq)
+            os.remove(rotated_path)
+
+        self._thread = threading.Thread(target=self._run, name="journal-flusher", daemon=True)
+        self._thread.start()
+
+    def append(self, op, activity, email):
+        """Queue a mutation and return its sequence number"""
+        with self._lock:
+            self._seq += 1
+            record = {"seq": self._seq, "op": op, "activity": activity, "email": email}
+            self._pending.append(json.dumps(record, ensure_ascii=False) + "\n")
+            return self._seq
+
+    def wait_durable(self, seq):
+        """Block until the record with this sequence number is on disk"""
+        with self._lock:
+            while self._durable_seq < seq and not self._closed:
+                self._durable.wait()
+
+    def sync(self):
+        """Block until everything appended so far is on disk"""
+        with self._lock:
+            seq = self._seq
+        self.wait_durable(seq)
+
+    def close(self):
+        """Flush everything still queued and stop the background thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._thread.join()
+        self._flush()
+        self._file.close()
+        with self._lock:
+            self._durable.notify_all()
+
+    def _run(self):
+        while not self._closed:
+            time.sleep(self.flush_interval)
+            self._flush()
+            if time.monotonic() - self._last_compaction >= self.compact_interval:
+                self._compact()
+
+    def _flush(self):
+        with self._lock:
+            lines, self._pending = self._pending, []
+            seq = self._seq
+            handle = self._file
+        if lines:
+            handle.writelines(lines)
+            handle.flush()
+            os.fsync(handle.fileno())
+        with self._lock:
+            self._durable_seq = seq
+            self._durable.notify_all()
+
+    def _compact(self):
+        """Write a snapshot of every roster and waitlist and drop the journal behind it"""
+        self._last_compaction = time.monotonic()
+        journal_path = os.path.join(self.directory, JOURNAL_FILE)
+        rotated_path = os.path.join(self.directory, ROTATED_FILE)
+
+        # Rotate under the lock so every record up to seq lands in the old file
+        self._flush()
+        with self._lock:
+            self._file.writelines(self._pending)
+            self._pending = []
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(journal_path, rotated_path)
+            self._file = open(journal_path, "a", encoding="utf-8")
+            seq = self._durable_seq = self._seq
+            self._durable.notify_all()
+
+        self._write_snapshot(seq)
+        os.remove(rotated_path)
+
+    def _write_snapshot(self, seq):
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        temp_path = snapshot_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            json.dump({"seq": seq, **self._snapshot()}, handle, ensure_ascii=False)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, snapshot_path)
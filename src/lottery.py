@@ -0,0 +1,190 @@
+"""
+Preference collection and lottery allocation for oversubscribed activities.
+
+While a lottery window is open, signups only record ranked choices in a
+PreferenceBook. When the window closes, allocate() draws one random order
+of all students and lets each, in that order, take their highest-ranked
+activity that still has a seat. This is random serial dictatorship, which
+is the same matching as student-proposing deferred acceptance with a
+single lottery as every activity's priority: the result is stable and
+nobody gains by misreporting their ranking.
+
+Students can be weighted (for example by grade) so they tend to draw
+earlier; the order then comes from the Efraimidis-Spirakis sampling key
+random() ** (1 / weight). Everything is driven by one random.Random seeded
+from the caller, and students are sorted before drawing, so a seed always
+reproduces the same allocation for audits.
+
+Allocation is a shuffle plus one pass over the ranked choices, so 50k
+students with a handful of choices each allocate in well under a second.
+"""
+
+import random
+import threading
+from collections import namedtuple
+
+Allocation = namedtuple("Allocation", "seed assignments unassigned ranks")
+Allocation.__doc__ = """Result of allocate().
+
+assignments maps each activity to the emails it received in draw order,
+unassigned lists students who got no seat at all, and ranks counts how many
+seats were filled from each student's 1st, 2nd, ... choice.
+"""
+
+
+class LotteryClosed(Exception):
+    """Raised when a choice is made after the lottery window closed"""
+
+
+class PreferenceBook:
+    """Ranked activity choices per student, collected during a lottery window.
+
+    close() ends the window and hands over the choices in one step under the
+    book's lock, so no choice can be accepted after it and then lost.
+    """
+
+    def __init__(self, is_open=True):
+        self._lock = threading.Lock()
+        self._open = is_open
+        # email -> activity names, best first
+        self._choices = {}
+
+    def __len__(self):
+        return len(self._choices)
+
+    @property
+    def is_open(self):
+        return self._open
+
+    def add(self, email, activity):
+        """Append an activity as the student's next choice; returns its
+        1-based rank, or None if it was already chosen"""
+        with self._lock:
+            if not self._open:
+                raise LotteryClosed
+            choices = self._choices.setdefault(email, [])
+            if activity in choices:
+                return None
+            choices.append(activity)
+            return len(choices)
+
+    def remove(self, email, activity):
+        """Drop one choice; returns whether the student had made it"""
+        with self._lock:
+            choices = self._choices.get(email)
+            if not self._open or not choices or activity not in choices:
+                return False
+            choices.remove(activity)
+            if not choices:
+                del self._choices[email]
+            return True
+
+    def set(self, email, activities):
+        """Replace a student's ranking; duplicates keep their first place"""
+        choices = list(dict.fromkeys(activities))
+        with self._lock:
+            if not self._open:
+                raise LotteryClosed
+            if choices:
+                self._choices[email] = choices
+            else:
+                self._choices.pop(email, None)
+
+    def choices(self, email):
+        with self._lock:
+            return list(self._choices.get(email, ()))
+
+    def close(self):
+        """End the window and return {email: [activity names]}, or None if
+        it was already closed; the book is left empty"""
+        with self._lock:
+            if not self._open:
+                return None
+            self._open = False
+            choices, self._choices = self._choices, {}
+            return choices
+
+    def reopen(self, choices):
+        """Open the window again with the choices close() returned"""
+        with self._lock:
+            self._choices = choices
+            self._open = True
+
+
+def draw_order(students, seed, weights=None):
+    """Return the students in lottery order for a seed.
+
+    With weights ({email: positive number}, default 1), a student with
+    weight w is w times as likely as a weight-1 student to draw ahead.
+    """
+    rng = random.Random(seed)
+    order = sorted(students)
+    if weights is None:
+        rng.shuffle(order)
+        return order
+    if any(not weight > 0 for weight in weights.values()):
+        raise ValueError("Lottery weights must be positive")
+    keys = {
+        email: rng.random() ** (1.0 / weights.get(email, 1.0))
+        for email in order
+    }
+    order.sort(key=keys.__getitem__, reverse=True)
+    return order
+
+
+def allocate(preferences, capacities, seed, weights=None, seats_per_student=1):
+    """Allocate seats by lottery.
+
+    preferences maps email -> ranked activity names, capacities maps
+    activity name -> free seats; choices of unknown activities are ignored.
+    With seats_per_student above 1, students pick in rounds: everyone's
+    best remaining choice in draw order, then the next round.
+    """
+    remaining = dict(capacities)
+    order = draw_order(preferences, seed, weights)
+    assignments = {name: [] for name in remaining}
+    ranks = {}
+    # Index of each student's next choice to try
+    cursors = dict.fromkeys(order, 0)
+    placed = dict.fromkeys(order, 0)
+
+    for _ in range(seats_per_student):
+        any_placed = False
+        for email in order:
+            choices = preferences[email]
+            cursor = cursors[email]
+            while cursor < len(choices):
+                name = choices[cursor]
+                cursor += 1
+                if remaining.get(name, 0) > 0:
+                    remaining[name] -= 1
+                    assignments[name].append(email)
+                    ranks[cursor] = ranks.get(cursor, 0) + 1
+                    placed[email] += 1
+                    any_placed = True
+                    break
+            cursors[email] = cursor
+        if not any_placed:
+            break
+
+    unassigned = sorted(email for email, count in placed.items() if count == 0)
+    return Allocation(seed, assignments, unassigned, dict(sorted(ranks.items())))
+
+
+def confirm(allocation, preferences, assignments):
+    """Return the allocation restricted to `assignments`, the seats that
+    were actually taken, with ranks and unassigned students recounted.
+
+    A drawn seat can still be refused when it is written, for example if
+    the student is already waiting for that activity or someone signed up
+    for the seat after capacities were read.
+    """
+    ranks = {}
+    seated = set()
+    for name, emails in assignments.items():
+        for email in emails:
+            rank = preferences[email].index(name) + 1
+            ranks[rank] = ranks.get(rank, 0) + 1
+            seated.add(email)
+    unassigned = sorted(email for email in preferences if email not in seated)
+    return Allocation(allocation.seed, assignments, unassigned, dict(sorted(ranks.items())))
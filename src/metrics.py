@@ -0,0 +1,178 @@
+"""
+Request metrics in the Prometheus text exposition format.
+
+MetricsMiddleware times every HTTP request and records its count by
+method, route template and status, plus a latency histogram by method and
+route. Using the route template ("/activities/{activity_name}/signup")
+rather than the raw path keeps the number of series bounded.
+
+Recording must not become a point of contention, so each thread writes to
+its own shard of plain dicts and never takes a lock; the only lock guards
+the list of shards, taken once per thread. A scrape copies and sums the
+shards. Copying a dict is atomic under the GIL, and a counter read a moment
+before its increment only shows up on the next scrape.
+"""
+
+import bisect
+import threading
+import time
+
+from starlette.routing import Match
+
+# Upper bounds in seconds; the implicit last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Shard:
+    __slots__ = ("requests", "latencies")
+
+    def __init__(self):
+        # (method, route, status) -> count
+        self.requests = {}
+        # (method, route) -> [count per bucket..., +Inf count, sum of seconds]
+        self.latencies = {}
+
+
+class RequestMetrics:
+    """Per-thread request counters and latency histograms"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def observe(self, method, route, status, seconds):
+        shard = self._shard()
+        key = (method, route, status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        histogram = shard.latencies.get((method, route))
+        if histogram is None:
+            histogram = shard.latencies[(method, route)] = [0] * (len(self.buckets) + 2)
+        histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+        histogram[-1] += seconds
+
+    def collect(self):
+        """Return ({(method, route, status): count},
+        {(method, route): [bucket counts..., sum]}) summed over threads"""
+        with self._lock:
+            shards = list(self._shards)
+        requests = {}
+        latencies = {}
+        for shard in shards:
+            for key, count in dict(shard.requests).items():
+                requests[key] = requests.get(key, 0) + count
+            for key, histogram in dict(shard.latencies).items():
+                total = latencies.get(key)
+                if total is None:
+                    latencies[key] = list(histogram)
+                else:
+                    latencies[key] = [a + b for a, b in zip(total, histogram)]
+        return requests, latencies
+
+    def render(self):
+        requests, latencies = self.collect()
+        lines = [
+            "# HELP http_requests_total HTTP requests handled.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(requests.items()):
+            lines.append(
+                f"http_requests_total{_labels(method=method, route=route, status=status)} {count}"
+            )
+        lines += [
+            "# HELP http_request_duration_seconds Time to handle an HTTP request.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        bounds = [*(_number(bound) for bound in self.buckets), "+Inf"]
+        for (method, route), histogram in sorted(latencies.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, histogram):
+                cumulative += count
+                labels = _labels(method=method, route=route, le=bound)
+                lines.append(f"http_request_duration_seconds_bucket{labels} {cumulative}")
+            labels = _labels(method=method, route=route)
+            lines.append(f"http_request_duration_seconds_sum{labels} {_number(histogram[-1])}")
+            lines.append(f"http_request_duration_seconds_count{labels} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def render_gauge(name, help_text, samples):
+    """Render a gauge from [(labels dict, value)]"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(**labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsMiddleware:
+    """ASGI middleware feeding RequestMetrics; paths in exempt_paths, such as
+    long-lived streams, are not timed.
+
+    `routes` is used to label requests that were answered before reaching
+    the router, such as rate-limited ones.
+    """
+
+    def __init__(self, app, metrics, routes=(), exempt_paths=()):
+        self.app = app
+        self.metrics = metrics
+        self.routes = routes
+        self.exempt_paths = frozenset(exempt_paths)
+
+    def _route(self, scope):
+        # The router stores the matched route in the scope
+        route = scope.get("route")
+        if route is None:
+            for candidate in self.routes:
+                if candidate.matches(scope)[0] == Match.FULL:
+                    route = candidate
+                    break
+        return getattr(route, "path", None) or "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def record_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, record_status)
+        finally:
+            self.metrics.observe(
+                scope["method"],
+                self._route(scope),
+                status,
+                time.perf_counter() - start,
+            )
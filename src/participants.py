@@ -0,0 +1,47 @@
+"""
+Participant roster used by the in-memory activity store.
+
+A roster keeps student emails in signup order while giving constant-time
+membership checks, adds and removes, so a popular activity with thousands of
+participants costs the same per request as one with two.
+"""
+
+
+class ParticipantRoster:
+    """Insertion-ordered set of participant emails backed by a dict"""
+
+    __slots__ = ("_emails",)
+
+    def __init__(self, emails=()):
+        self._emails = dict.fromkeys(emails)
+
+    def __contains__(self, email):
+        return email in self._emails
+
+    def __len__(self):
+        return len(self._emails)
+
+    def __iter__(self):
+        return iter(self._emails)
+
+    def __repr__(self):
+        return f"ParticipantRoster({list(self._emails)!r})"
+
+    def add(self, email):
+        """Add an email; returns False if it was already present"""
+        if email in self._emails:
+            return False
+        self._emails[email] = None
+        return True
+
+    def remove(self, email):
+        """Remove an email; raises KeyError if it is not present"""
+        del self._emails[email]
+
+    def discard(self, email):
+        """Remove an email if present; returns whether it was removed"""
+        return self._emails.pop(email, False) is None
+
+    def to_list(self):
+        """Return the emails as a list in signup order"""
+        return list(self._emails)
@@ -0,0 +1,175 @@
+"""
+Sampling profiler and slow-request log.
+
+Sampler wakes up every few milliseconds on its own thread and records the
+Python stack of every other thread via sys._current_frames(). It never
+instruments the code being profiled, so its cost is one stack walk per
+thread per interval, and it only runs while someone asked for a profile.
+Stacks are reported in the collapsed format ("outer;inner;leaf count" per
+line) that flamegraph.pl, speedscope and similar tools read directly.
+
+By default only stacks passing through the application package are kept,
+which drops idle threadpool workers and the event loop waiting for I/O.
+
+SlowRequestLog is an ASGI middleware that arms a timer per request. If the
+request is still running when the timer fires, the stacks of the threads
+busy in application code are captured right then, while the slow work is
+still on them, and logged with the request once it finishes.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Long-lived helper threads that sit in application code while idle
+BACKGROUND_THREADS = frozenset({
+    "sampling-profiler", "journal-flusher", "catalogue-watcher", "change-relay",
+})
+
+
+class FrameLabels:
+    """Caches a "function (file:line)" label per code object"""
+
+    def __init__(self):
+        self._labels = {}
+
+    def __call__(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            parent = os.path.basename(os.path.dirname(path))
+            short = f"{parent}/{os.path.basename(path)}" if parent else os.path.basename(path)
+            label = self._labels[code] = f"{code.co_name} ({short}:{code.co_firstlineno})"
+        return label
+
+
+def background_thread_ids():
+    return {thread.ident for thread in threading.enumerate() if thread.name in BACKGROUND_THREADS}
+
+
+def capture_stacks(labels, root=APP_ROOT, exclude=()):
+    """Return [(thread id, stack tuple root first)] for threads whose stack
+    passes through files under `root` (every thread if root is None)"""
+    stacks = []
+    for thread_id, frame in sys._current_frames().items():
+        if thread_id in exclude:
+            continue
+        codes = []
+        in_app = root is None
+        while frame is not None:
+            code = frame.f_code
+            codes.append(code)
+            if not in_app and code.co_filename.startswith(root):
+                in_app = True
+            frame = frame.f_back
+        if in_app:
+            stacks.append((thread_id, tuple(labels(code) for code in reversed(codes))))
+    return stacks
+
+
+def collapse(counts):
+    """Render {stack: samples} in the collapsed stack format, hottest first"""
+    return "".join(
+        f"{';'.join(stack)} {count}\n"
+        for stack, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    )
+
+
+class Sampler:
+    """Background thread sampling every thread's stack at a fixed interval"""
+
+    def __init__(self, interval=0.005, root=APP_ROOT):
+        self.interval = interval
+        self.root = root
+        self.samples = 0
+        self.counts = Counter()
+        self._labels = FrameLabels()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and return {stack: samples}"""
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self):
+        next_sample = time.perf_counter()
+        while not self._stop.is_set():
+            # Looked up per sample, since helper threads may start meanwhile
+            exclude = background_thread_ids()
+            for _, stack in capture_stacks(self._labels, self.root, exclude):
+                self.counts[stack] += 1
+            self.samples += 1
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                # Fell behind; skip the missed samples instead of bursting
+                next_sample = time.perf_counter()
+
+
+class SlowRequestLog:
+    """ASGI middleware logging requests slower than `threshold` seconds with
+    the application stacks seen once the threshold passed.
+
+    Each slow request is also appended to `entries` as a dict; pass a
+    bounded deque to keep the most recent ones.
+    """
+
+    def __init__(self, app, entries, threshold=1.0, exempt_paths=()):
+        self.app = app
+        self.threshold = threshold
+        self.entries = entries
+        self.exempt_paths = frozenset(exempt_paths)
+        self._labels = FrameLabels()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        captured = []
+        loop_thread = threading.get_ident()
+
+        def capture():
+            exclude = background_thread_ids()
+            exclude.add(loop_thread)
+            captured.extend(stack for _, stack in capture_stacks(self._labels, exclude=exclude))
+
+        start = time.perf_counter()
+        timer = asyncio.get_running_loop().call_later(self.threshold, capture)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            timer.cancel()
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.threshold:
+                self._record(scope, elapsed, captured)
+
+    def _record(self, scope, elapsed, stacks):
+        entry = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "seconds": round(elapsed, 4),
+            "stacks": collapse(Counter(stacks)).splitlines(),
+        }
+        self.entries.append(entry)
+        logger.warning(
+            "Slow request %s %s took %.0f ms; application stacks at %.0f ms:\n%s",
+            entry["method"], entry["path"], elapsed * 1000, self.threshold * 1000,
+            "\n".join(entry["stacks"]) or "(none on worker threads)",
+        )
@@ -0,0 +1,160 @@
+"""
+Rate limiting and load shedding for the activities API.
+
+RateLimiter keeps a token bucket per key (client IP, student email) in an
+LRU of bounded size, so a flood of distinct keys evicts the least recently
+seen buckets instead of growing memory. An evicted key simply starts again
+with a full bucket.
+
+LoadShedder caps the number of requests being handled at once. Sync route
+handlers run on a fixed-size threadpool; once it is saturated, new
+requests queue behind slow ones and everybody's latency grows. Refusing
+the excess up front with 503 keeps the threadpool below that point.
+
+SignupGuard is the ASGI middleware that applies both: signups are rate
+limited per IP and per email with 429, and every request except the
+long-lived event streams counts towards the in-flight cap.
+"""
+
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+
+class RateLimiter:
+    """Token buckets per (kind, value) key.
+
+    limits maps each kind of key to (rate, burst): buckets refill at `rate`
+    tokens per second up to `burst`. Kinds without a limit are not limited.
+    """
+
+    def __init__(self, limits, max_keys=100_000, clock=time.monotonic):
+        self.limits = limits
+        self.max_keys = max_keys
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> [tokens, time of last refill], least recently used first
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def acquire(self, keys):
+        """Take one token from every key's bucket.
+
+        Tokens are only taken when every bucket has one. Returns 0 on
+        success, otherwise the seconds until all of them will.
+        """
+        now = self._clock()
+        with self._lock:
+            buckets = []
+            wait = 0.0
+            for key in keys:
+                limit = self.limits.get(key[0])
+                if limit is None:
+                    continue
+                rate, burst = limit
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = [burst, now]
+                    if len(self._buckets) > self.max_keys:
+                        self._buckets.popitem(last=False)
+                else:
+                    self._buckets.move_to_end(key)
+                    bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                    bucket[1] = now
+                if bucket[0] < 1:
+                    wait = max(wait, (1 - bucket[0]) / rate)
+                buckets.append(bucket)
+            if wait:
+                return wait
+            for bucket in buckets:
+                bucket[0] -= 1
+            return 0
+
+
+class LoadShedder:
+    """Counts requests in flight and refuses any beyond `limit`"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+def is_signup(method, path):
+    return method == "POST" and path.startswith("/activities/") and (
+        path.endswith("/signup") or path == "/activities/batch-signup"
+    )
+
+
+class SignupGuard:
+    """ASGI middleware applying a RateLimiter to signups and a LoadShedder to
+    everything but streaming endpoints; either may be None to disable it"""
+
+    def __init__(self, app, limiter=None, shedder=None, exempt_paths=(),
+                 shed_retry_after=1):
+        self.app = app
+        self.limiter = limiter
+        self.shedder = shedder
+        self.exempt_paths = frozenset(exempt_paths)
+        self.shed_retry_after = shed_retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        if self.limiter is not None and is_signup(scope["method"], scope["path"]):
+            wait = self.limiter.acquire(self._keys(scope))
+            if wait:
+                await _reject(send, 429, "Too many signup attempts", wait)
+                return
+
+        if self.shedder is None:
+            await self.app(scope, receive, send)
+            return
+        if not self.shedder.acquire():
+            await _reject(send, 503, "Server is busy", self.shed_retry_after)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.shedder.release()
+
+    @staticmethod
+    def _keys(scope):
+        client = scope.get("client")
+        keys = [("ip", client[0] if client else "")]
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        for email in query.get("email", ())[:1]:
+            keys.append(("email", email.strip().lower()))
+        return keys
+
+
+async def _reject(send, status, detail, retry_after):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,278 @@
+"""
+Structured weekly schedules and an interval index over them.
+
+Activity schedules are free text such as "Tuesdays and Thursdays, 3:30 PM -
+4:30 PM". parse_schedule() turns that into weekly intervals once, when an
+activity is loaded, so queries never touch the text again. Times are
+minutes since Monday 00:00, which makes every interval a plain pair of
+integers on one weekly axis.
+
+ScheduleIndex keeps all intervals sorted by start. Because no session is
+longer than the longest one indexed, every session overlapping a window
+starts less than that length before the window, so overlap and "starts
+between" queries are a binary search plus the hits.
+
+Timetables keeps a ScheduleIndex per student, updated as they sign up and
+leave, for conflict checks against a store owned by this process.
+StoreTimetables answers the same questions from the store's enrollments
+on every check, for stores that other worker processes also write to.
+"""
+
+import bisect
+import re
+import threading
+from collections import namedtuple
+
+MINUTES_PER_DAY = 24 * 60
+
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+_DAY_PREFIXES = {
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6,
+}
+
+_TIME = r"(\d{1,2})(?::(\d{2}))?\s*([AaPp]\.?[Mm]\.?)?"
+_RANGE_RE = re.compile(_TIME + r"\s*[-–]\s*" + _TIME)
+_TIME_RE = re.compile(r"^\s*" + _TIME + r"\s*$")
+_WORD_RE = re.compile(r"[A-Za-z]+")
+
+
+class Session(namedtuple("Session", "day start end")):
+    """One weekly meeting; start and end are minutes since Monday 00:00"""
+
+    __slots__ = ()
+
+    def to_dict(self):
+        return {
+            "day": DAYS[self.day],
+            "start": format_minutes(self.start % MINUTES_PER_DAY),
+            "end": format_minutes(self.end % MINUTES_PER_DAY),
+        }
+
+
+def format_minutes(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _to_minutes(hour, minute, meridiem):
+    hour = int(hour)
+    minute = int(minute or 0)
+    if meridiem:
+        meridiem = meridiem.replace(".", "").lower()
+        if not 1 <= hour <= 12:
+            raise ValueError(f"Invalid hour: {hour}")
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"Invalid time: {hour}:{minute:02d}")
+    return hour * 60 + minute
+
+
+def parse_day(text):
+    """Return the weekday index for a day name such as "Tue" or "Tuesdays" """
+    day = _DAY_PREFIXES.get(text.strip()[:3].lower())
+    if day is None:
+        raise ValueError(f"Unknown day: {text!r}")
+    return day
+
+
+def parse_time(text):
+    """Return minutes since midnight for "4 PM", "4:30 pm" or "16:30" """
+    match = _TIME_RE.match(text)
+    if not match:
+        raise ValueError(f"Unknown time: {text!r}")
+    return _to_minutes(*match.groups())
+
+
+def parse_schedule(text):
+    """Parse a schedule string into a tuple of Sessions, earliest first.
+
+    Raises ValueError when no day or no time range can be found.
+    """
+    time_range = _RANGE_RE.search(text)
+    if time_range is None:
+        raise ValueError(f"No time range in schedule: {text!r}")
+    start_hour, start_minute, start_meridiem, end_hour, end_minute, end_meridiem = time_range.groups()
+    # "2:00 - 3:00 PM" shares the meridiem of the end time
+    start = _to_minutes(start_hour, start_minute, start_meridiem or end_meridiem)
+    end = _to_minutes(end_hour, end_minute, end_meridiem)
+    if end <= start:
+        raise ValueError(f"Schedule ends before it starts: {text!r}")
+
+    days = sorted({
+        _DAY_PREFIXES[word[:3].lower()]
+        for word in _WORD_RE.findall(text[:time_range.start()])
+        if word[:3].lower() in _DAY_PREFIXES
+    })
+    if not days:
+        raise ValueError(f"No days in schedule: {text!r}")
+
+    return tuple(
+        Session(day, day * MINUTES_PER_DAY + start, day * MINUTES_PER_DAY + end)
+        for day in days
+    )
+
+
+class ScheduleIndex:
+    """Sorted index of every activity's weekly sessions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (start, end, activity name), sorted
+        self._entries = []
+        self._sessions = {}
+        self._longest = 0
+
+    def add(self, name, sessions):
+        """Index an activity's sessions, replacing any earlier ones"""
+        with self._lock:
+            self._remove(name)
+            for session in sessions:
+                bisect.insort(self._entries, (session.start, session.end, name))
+                self._longest = max(self._longest, session.end - session.start)
+            self._sessions[name] = tuple(sessions)
+
+    def remove(self, name):
+        with self._lock:
+            self._remove(name)
+
+    def _remove(self, name):
+        for session in self._sessions.pop(name, ()):
+            position = bisect.bisect_left(self._entries, (session.start, session.end, name))
+            del self._entries[position]
+
+    def sessions(self, name):
+        return self._sessions.get(name, ())
+
+    def activities(self):
+        return list(self._sessions)
+
+    def starting_between(self, start, end):
+        """Return [(name, Session)] for sessions starting in [start, end)"""
+        with self._lock:
+            low = bisect.bisect_left(self._entries, (start,))
+            high = bisect.bisect_left(self._entries, (end,))
+            entries = self._entries[low:high]
+        return [(name, Session(begin // MINUTES_PER_DAY, begin, finish))
+                for begin, finish, name in entries]
+
+    def overlapping(self, start, end):
+        """Return [(name, Session)] for sessions overlapping [start, end)"""
+        with self._lock:
+            low = bisect.bisect_right(self._entries, (start - self._longest,))
+            high = bisect.bisect_left(self._entries, (end,))
+            entries = [entry for entry in self._entries[low:high] if entry[1] > start]
+        return [(name, Session(begin // MINUTES_PER_DAY, begin, finish))
+                for begin, finish, name in entries]
+
+
+def _timetable(schedule_index, activities):
+    timetable = ScheduleIndex()
+    for name in activities:
+        sessions = schedule_index.sessions(name)
+        if sessions:
+            timetable.add(name, sessions)
+    return timetable
+
+
+def _clashes(schedule_index, timetable, activity):
+    clashes = set()
+    for session in schedule_index.sessions(activity):
+        for name, _ in timetable.overlapping(session.start, session.end):
+            if name != activity:
+                clashes.add(name)
+    return sorted(clashes)
+
+
+def _overlapping_pairs(timetable):
+    found = []
+    for name in sorted(timetable.activities()):
+        for session in timetable.sessions(name):
+            for other, other_session in timetable.overlapping(session.start, session.end):
+                # Report each pair once
+                if other <= name:
+                    continue
+                start = max(session.start, other_session.start)
+                end = min(session.end, other_session.end)
+                found.append((name, other, Session(session.day, start, end)))
+    return found
+
+
+def conflicts_with(schedule_index, activities, activity):
+    """Return the sorted names of `activities` whose sessions overlap those
+    of `activity`"""
+    return _clashes(schedule_index, _timetable(schedule_index, activities), activity)
+
+
+class Timetables:
+    """Per-student interval sets of the sessions each student is enrolled in.
+
+    Checking a new activity against a student's timetable costs a binary
+    search per session of that activity, however many activities the
+    student already has.
+    """
+
+    def __init__(self, schedule_index):
+        self._schedule_index = schedule_index
+        self._lock = threading.Lock()
+        # email -> ScheduleIndex of that student's sessions
+        self._students = {}
+
+    def enroll(self, email, activity):
+        sessions = self._schedule_index.sessions(activity)
+        if not sessions:
+            return
+        with self._lock:
+            timetable = self._students.get(email)
+            if timetable is None:
+                timetable = self._students[email] = ScheduleIndex()
+        timetable.add(activity, sessions)
+
+    def drop(self, email, activity):
+        timetable = self._students.get(email)
+        if timetable is not None:
+            timetable.remove(activity)
+
+    def remove_activity(self, activity):
+        """Drop an activity from every student's timetable"""
+        with self._lock:
+            timetables = list(self._students.values())
+        for timetable in timetables:
+            timetable.remove(activity)
+
+    def conflicts_with(self, email, activity):
+        """Return the sorted names of the student's activities that overlap `activity`"""
+        timetable = self._students.get(email)
+        if timetable is None:
+            return []
+        return _clashes(self._schedule_index, timetable, activity)
+
+    def conflicts(self, email):
+        """Return [(activity, other activity, overlapping Session)] for a student"""
+        timetable = self._students.get(email)
+        if timetable is None:
+            return []
+        return _overlapping_pairs(timetable)
+
+
+class StoreTimetables:
+    """Timetables read from the store on every check.
+
+    For a store shared by several worker processes, where a copy kept in
+    step by this process's listeners would miss the others' signups. Each
+    check indexes the student's enrolled sessions afresh, which costs a
+    store read plus a sort of those sessions.
+    """
+
+    def __init__(self, schedule_index, store):
+        self._schedule_index = schedule_index
+        self._store = store
+
+    def conflicts_with(self, email, activity):
+        """Return the sorted names of the student's activities that overlap `activity`"""
+        enrolled = self._store.student_activities(email)
+        return conflicts_with(self._schedule_index, enrolled, activity)
+
+    def conflicts(self, email):
+        """Return [(activity, other activity, overlapping Session)] for a student"""
+        return _overlapping_pairs(
+            _timetable(self._schedule_index, self._store.student_activities(email))
+        )
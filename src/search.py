@@ -0,0 +1,122 @@
+"""
+In-memory inverted index for searching activities by name and description.
+
+Text is normalized (accents stripped, case folded) and split into
+alphanumeric tokens. Each token maps to the activities containing it with a
+weight: name tokens count more than description tokens. Every query token
+must match, either exactly or as a prefix of an indexed token, and results
+are ranked by the summed weight of the matches scaled by how rare each
+token is. Prefix lookups use a sorted vocabulary, so they cost a binary
+search plus the matching tokens rather than a scan of every activity.
+
+Documents can be added, replaced or removed one at a time, so edits to the
+catalogue only touch the tokens of the activities that changed.
+"""
+
+import bisect
+import heapq
+import math
+import re
+import threading
+import unicodedata
+
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+# Prefix matches rank below exact matches of the same token
+PREFIX_PENALTY = 0.5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Split text into normalized tokens"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _TOKEN_RE.findall(stripped.casefold())
+
+
+class SearchIndex:
+    """Inverted index over activity names and descriptions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # token -> {activity name: weight}
+        self._postings = {}
+        # activity name -> tokens it contributed, for removal
+        self._documents = {}
+        # Sorted list of every indexed token, for prefix lookups
+        self._vocabulary = []
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, name, description):
+        """Index an activity, replacing any earlier version of it"""
+        weights = {}
+        for token in tokenize(name):
+            weights[token] = weights.get(token, 0.0) + NAME_WEIGHT
+        for token in tokenize(description):
+            weights[token] = weights.get(token, 0.0) + DESCRIPTION_WEIGHT
+
+        with self._lock:
+            self._remove(name)
+            for token, weight in weights.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    bisect.insort(self._vocabulary, token)
+                postings[name] = weight
+            self._documents[name] = tuple(weights)
+
+    def remove(self, name):
+        with self._lock:
+            self._remove(name)
+
+    def _remove(self, name):
+        for token in self._documents.pop(name, ()):
+            postings = self._postings[token]
+            del postings[name]
+            if not postings:
+                del self._postings[token]
+                position = bisect.bisect_left(self._vocabulary, token)
+                del self._vocabulary[position]
+
+    def _expand(self, query_token):
+        """Yield (indexed token, factor) for exact and prefix matches"""
+        vocabulary = self._vocabulary
+        position = bisect.bisect_left(vocabulary, query_token)
+        while position < len(vocabulary) and vocabulary[position].startswith(query_token):
+            token = vocabulary[position]
+            yield token, 1.0 if token == query_token else PREFIX_PENALTY
+            position += 1
+
+    def search(self, query, limit=20):
+        """Return [(activity name, score)] best first; every query token must match"""
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            total = len(self._documents)
+            scores = None
+            for query_token in query_tokens:
+                token_scores = {}
+                for token, factor in self._expand(query_token):
+                    postings = self._postings[token]
+                    idf = math.log(1 + total / len(postings))
+                    for name, weight in postings.items():
+                        score = weight * idf * factor
+                        if score > token_scores.get(name, 0.0):
+                            token_scores[name] = score
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {
+                        name: score + token_scores[name]
+                        for name, score in scores.items()
+                        if name in token_scores
+                    }
+                if not scores:
+                    return []
+
+        return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
@@ -4,50 +4,174 @@ document.addEventListener("DOMContentLoaded", () => {
   const signupForm = document.getElementById("signup-form");
   const messageDiv = document.getElementById("message");
 
+  // ETag and store version of the catalogue currently on screen
+  let activitiesEtag = null;
+  let renderedVersion = -1;
+
+  // Live updates: while a fetch is in flight, events are held back and
+  // replayed on top of the fresh render
+  let eventsConnected = false;
+  let fetchesInFlight = 0;
+  let pendingEvents = [];
+
+  // ETags look like "<store id>-<version>"
+  function versionFromEtag(etag) {
+    const match = etag && etag.match(/-(\d+)"$/);
+    return match ? Number(match[1]) : -1;
+  }
+
+  function createParticipantItem(activity, email) {
+    const item = document.createElement("li");
+    item.dataset.email = email;
+
+    const emailSpan = document.createElement("span");
+    emailSpan.className = "participant-email";
+    emailSpan.textContent = email;
+
+    const deleteButton = document.createElement("button");
+    deleteButton.className = "delete-btn";
+    deleteButton.dataset.activity = activity;
+    deleteButton.dataset.email = email;
+    deleteButton.textContent = "❌";
+    deleteButton.addEventListener("click", handleUnregister);
+
+    item.append(emailSpan, deleteButton);
+    return item;
+  }
+
+  // Show either the participant list or the "No participants yet" note
+  function updateParticipantsSection(card) {
+    const list = card.querySelector(".participants-list");
+    const hasParticipants = list.children.length > 0;
+    card.querySelector(".participants-section").hidden = !hasParticipants;
+    card.querySelector(".no-participants").hidden = hasParticipants;
+  }
+
+  function renderActivityCard(name, details) {
+    const activityCard = document.createElement("div");
+    activityCard.className = "activity-card";
+    activityCard.dataset.activity = name;
+
+    const spotsLeft = details.max_participants - details.participants.length;
+
+    activityCard.innerHTML = `
+      <h4></h4>
+      <p class="activity-description"></p>
+      <p><strong>Schedule:</strong> <span class="activity-schedule"></span></p>
+      <p><strong>Availability:</strong> <span class="spots-left">${spotsLeft}</span> spots left</p>
+      <div class="participants-container">
+        <div class="participants-section">
+          <h5>Participants:</h5>
+          <ul class="participants-list"></ul>
+        </div>
+        <p class="no-participants"><em>No participants yet</em></p>
+      </div>
+    `;
+    activityCard.querySelector("h4").textContent = name;
+    activityCard.querySelector(".activity-description").textContent =
+      details.description;
+    activityCard.querySelector(".activity-schedule").textContent =
+      details.schedule;
+
+    const list = activityCard.querySelector(".participants-list");
+    details.participants.forEach((email) => {
+      list.appendChild(createParticipantItem(name, email));
+    });
+    updateParticipantsSection(activityCard);
+
+    return activityCard;
+  }
+
+  function findActivityCard(name) {
+    return Array.from(activitiesList.children).find(
+      (card) => card.dataset.activity === name
+    );
+  }
+
+  // Apply one enrollment change to the page without refetching
+  function applyEnrollmentEvent(event) {
+    if (event.version <= renderedVersion) {
+      return;
+    }
+
+    // An activity was added, removed or edited; reload the catalogue
+    if (event.op === "catalogue") {
+      fetchActivities();
+      return;
+    }
+    renderedVersion = event.version;
+
+    const card = findActivityCard(event.activity);
+    if (!card) {
+      return;
+    }
+
+    card.querySelector(".spots-left").textContent = event.remaining_spots;
+
+    const list = card.querySelector(".participants-list");
+    const existing = Array.from(list.children).find(
+      (item) => item.dataset.email === event.email
+    );
+    if (event.op === "signup" && !existing) {
+      list.appendChild(createParticipantItem(event.activity, event.email));
+    } else if (event.op === "unregister" && existing) {
+      existing.remove();
+    }
+    updateParticipantsSection(card);
+  }
+
+  function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+      return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+  }
+
+  // Send a signup or unregister, retrying network errors. The retries
+  // reuse one Idempotency-Key, so if an earlier attempt did reach the
+  // server, the retry gets its response instead of an error.
+  async function sendChange(url, method, retries = 2) {
+    const headers = { "Idempotency-Key": newIdempotencyKey() };
+    for (let attempt = 0; ; attempt += 1) {
+      try {
+        return await fetch(url, { method, headers });
+      } catch (error) {
+        if (attempt >= retries) {
+          throw error;
+        }
+        await new Promise((resolve) => setTimeout(resolve, 250 * 2 ** attempt));
+      }
+    }
+  }
+
   // Function to fetch activities from API
   async function fetchActivities() {
+    fetchesInFlight += 1;
     try {
-      const response = await fetch("/activities");
+      const headers = activitiesEtag ? { "If-None-Match": activitiesEtag } : {};
+      const response = await fetch("/activities", {
+        headers,
+        cache: "no-store",
+      });
+
+      // Nothing changed since the last render
+      if (response.status === 304) {
+        return;
+      }
+
       const activities = await response.json();
+      activitiesEtag = response.headers.get("ETag");
+      renderedVersion = versionFromEtag(activitiesEtag);
 
-      // Clear loading message
+      // Clear loading message and previously loaded options
       activitiesList.innerHTML = "";
+      activitySelect
+        .querySelectorAll("option:not([value=''])")
+        .forEach((option) => option.remove());
 
       // Populate activities list
       Object.entries(activities).forEach(([name, details]) => {
-        const activityCard = document.createElement("div");
-        activityCard.className = "activity-card";
-
-        const spotsLeft =
-          details.max_participants - details.participants.length;
-
-        // Create participants HTML with delete icons instead of bullet points
-        const participantsHTML =
-          details.participants.length > 0
-            ? `<div class="participants-section">
-              <h5>Participants:</h5>
-              <ul class="participants-list">
-                ${details.participants
-                  .map(
-                    (email) =>
-                      `<li><span class="participant-email">${email}</span><button class="delete-btn" data-activity="${name}" data-email="${email}">❌</button></li>`
-                  )
-                  .join("")}
-              </ul>
-            </div>`
-            : `<p><em>No participants yet</em></p>`;
-
-        activityCard.innerHTML = `
-          <h4>${name}</h4>
-          <p>${details.description}</p>
-          <p><strong>Schedule:</strong> ${details.schedule}</p>
-          <p><strong>Availability:</strong> ${spotsLeft} spots left</p>
-          <div class="participants-container">
-            ${participantsHTML}
-          </div>
-        `;
-
-        activitiesList.appendChild(activityCard);
+        activitiesList.appendChild(renderActivityCard(name, details));
 
         // Add option to select dropdown
         const option = document.createElement("option");
@@ -55,15 +179,57 @@ document.addEventListener("DOMContentLoaded", () => {
         option.textContent = name;
         activitySelect.appendChild(option);
       });
-
-      // Add event listeners to delete buttons
-      document.querySelectorAll(".delete-btn").forEach((button) => {
-        button.addEventListener("click", handleUnregister);
-      });
     } catch (error) {
       activitiesList.innerHTML =
         "<p>Failed to load activities. Please try again later.</p>";
       console.error("Error fetching activities:", error);
+    } finally {
+      fetchesInFlight -= 1;
+      if (fetchesInFlight === 0) {
+        const events = pendingEvents;
+        pendingEvents = [];
+        events.forEach(applyEnrollmentEvent);
+      }
+    }
+  }
+
+  // Subscribe to enrollment changes made by anyone
+  function connectEvents() {
+    if (!window.EventSource) {
+      return;
+    }
+    const source = new EventSource("/activities/events");
+
+    source.addEventListener("open", () => {
+      eventsConnected = true;
+      // Catch up on anything missed while disconnected
+      fetchActivities();
+    });
+
+    source.addEventListener("enrollment", (message) => {
+      const event = JSON.parse(message.data);
+      if (fetchesInFlight > 0) {
+        pendingEvents.push(event);
+      } else {
+        applyEnrollmentEvent(event);
+      }
+    });
+
+    // The server dropped events for us; reload the catalogue
+    source.addEventListener("resync", () => {
+      fetchActivities();
+    });
+
+    // EventSource reconnects on its own
+    source.addEventListener("error", () => {
+      eventsConnected = false;
+    });
+  }
+
+  // Without a live stream, refetch to show the change
+  function refreshAfterChange() {
+    if (!eventsConnected) {
+      fetchActivities();
     }
   }
 
@@ -74,13 +240,11 @@ document.addEventListener("DOMContentLoaded", () => {
     const email = button.getAttribute("data-email");
 
     try {
-      const response = await fetch(
+      const response = await sendChange(
         `/activities/${encodeURIComponent(
           activity
         )}/unregister?email=${encodeURIComponent(email)}`,
-        {
-          method: "DELETE",
-        }
+        "DELETE"
       );
 
       const result = await response.json();
@@ -90,7 +254,7 @@ document.addEventListener("DOMContentLoaded", () => {
         messageDiv.className = "success";
 
         // Refresh activities list to show updated participants
-        fetchActivities();
+        refreshAfterChange();
       } else {
         messageDiv.textContent = result.detail || "An error occurred";
         messageDiv.className = "error";
@@ -118,13 +282,11 @@ document.addEventListener("DOMContentLoaded", () => {
     const activity = document.getElementById("activity").value;
 
     try {
-      const response = await fetch(
+      const response = await sendChange(
         `/activities/${encodeURIComponent(
           activity
         )}/signup?email=${encodeURIComponent(email)}`,
-        {
-          method: "POST",
-        }
+        "POST"
       );
 
       const result = await response.json();
@@ -135,7 +297,7 @@ document.addEventListener("DOMContentLoaded", () => {
         signupForm.reset();
 
         // Refresh activities list to show updated participants
-        fetchActivities();
+        refreshAfterChange();
       } else {
         messageDiv.textContent = result.detail || "An error occurred";
         messageDiv.className = "error";
@@ -157,4 +319,5 @@ document.addEventListener("DOMContentLoaded", () => {
 
   // Initialize app
   fetchActivities();
+  connectEvents();
 });
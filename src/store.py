@@ -0,0 +1,909 @@
+"""
+Storage backends for the activities API.
+
+Route handlers talk to an ActivityStore rather than to a dict, so the
+in-memory store and the SQLite store are interchangeable. Both keep a
+version counter that every mutation bumps; the API uses it to cache the
+encoded catalogue and to build ETags.
+
+Mutating methods return a status string instead of raising, so callers can
+map statuses to HTTP errors or report them per item in batch requests:
+
+- add: "enrolled", "waitlisted", "duplicate", "full" or "unknown_activity"
+- remove: "removed", "left_waitlist", "not_enrolled" or "unknown_activity"
+
+update_catalogue() applies an edited catalogue in place: activities are
+added, removed or have their details changed, and everyone stays enrolled
+in the activities that remain. Each affected activity produces a change
+event with op "catalogue" and no email.
+
+With waitlists enabled, a signup for a full activity joins its FIFO
+waitlist instead of failing with "full". Whenever a seat frees up the
+student at the front is enrolled in the same critical section, so nobody
+can take the seat in between.
+"""
+
+import collections
+import itertools
+import queue
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+from . import journal as journal_log
+from .participants import ParticipantRoster
+from .waitlist import Waitlist
+
+# Activity fields that come from the catalogue rather than from signups
+CATALOGUE_FIELDS = ("description", "schedule", "max_participants")
+
+CatalogueChanges = collections.namedtuple("CatalogueChanges", "added removed changed")
+
+
+def diff_catalogue(current, catalogue):
+    """Return CatalogueChanges turning `current` ({name: details}) into
+    `catalogue`; changed lists activities whose catalogue fields differ"""
+    return CatalogueChanges(
+        added=[name for name in catalogue if name not in current],
+        removed=[name for name in current if name not in catalogue],
+        changed=[
+            name for name, details in catalogue.items()
+            if name in current and any(
+                details[field] != current[name][field] for field in CATALOGUE_FIELDS
+            )
+        ],
+    )
+
+
+class ActivityStore:
+    """Interface shared by every storage backend"""
+
+    #: Identifies this store's version sequence, so ETags from a store
+    #: whose counter restarted at zero are never mistaken for current ones
+    instance_id = ""
+
+    _listeners = ()
+
+    def add_listener(self, listener):
+        """Call listener(event) after every signup or unregister.
+
+        Events are dicts with activity, email, op ("signup" or
+        "unregister"), remaining_spots and the version the change produced.
+        A student enrolled off the waitlist produces a signup event with
+        "promoted": True, and update_catalogue() produces "catalogue" events
+        with email None. Listeners may run while a lock is held, so they
+        must be quick and must not call back into the store. MemoryStore
+        calls them in version order.
+        """
+        self._listeners = (*self._listeners, listener)
+
+    @staticmethod
+    def _change(op, name, email, remaining_spots, version):
+        # Promotions are logged as "promote" but reach listeners as signups
+        event = {
+            "activity": name,
+            "email": email,
+            "op": "signup" if op == "promote" else op,
+            "remaining_spots": remaining_spots,
+            "version": version,
+        }
+        if op == "promote":
+            event["promoted"] = True
+        return event
+
+    def _notify(self, event):
+        for listener in self._listeners:
+            listener(event)
+
+    @property
+    def version(self):
+        """Counter bumped by every mutation"""
+        raise NotImplementedError
+
+    def snapshot(self):
+        """Return (version, catalogue) with participants as lists in signup order"""
+        raise NotImplementedError
+
+    def get_activity(self, name):
+        """Return one activity like snapshot() does, or None if it does not exist"""
+        raise NotImplementedError
+
+    def activity_snapshot(self, name):
+        """Return (version, activity) for one activity, where every change to
+        it after the copy has a higher version; the activity may be None"""
+        raise NotImplementedError
+
+    def changes_since(self, version):
+        """Return (current version, change events after `version` in order).
+
+        Only a bounded window of recent changes is kept; the events are None
+        when `version` has fallen out of it and the client must resync.
+        """
+        raise NotImplementedError
+
+    def has_activity(self, name):
+        raise NotImplementedError
+
+    def add_participant(self, name, email):
+        return self.add_participants(name, [email])[0]
+
+    def add_participants(self, name, emails, join_waitlist=True):
+        """Add students to one activity in order, taking its lock once.
+
+        With join_waitlist False, students who find the activity full get
+        "full" even when waitlists are on.
+        """
+        raise NotImplementedError
+
+    def remove_participant(self, name, email):
+        """Unenroll a student, or take them off the waitlist if they are
+        waiting; a freed seat goes to the front of the waitlist"""
+        raise NotImplementedError
+
+    def waitlist(self, name):
+        """Return the emails waiting for an activity in order, or None if it
+        does not exist"""
+        raise NotImplementedError
+
+    def waitlist_position(self, name, email):
+        """Return a student's 1-based place on the waitlist, or None"""
+        raise NotImplementedError
+
+    def update_catalogue(self, catalogue):
+        """Apply an edited catalogue ({name: details} with seed participants
+        for new activities) and return its CatalogueChanges.
+
+        Existing activities keep their participants and waitlists; if their
+        capacity grows, the freed seats go to the waitlist. Nothing happens,
+        and the version stays put, when the catalogue has not changed.
+        """
+        raise NotImplementedError
+
+    def participant_counts(self):
+        """Return {activity name: number of participants}"""
+        raise NotImplementedError
+
+    def student_activities(self, email):
+        """Return the sorted names of the activities a student is in"""
+        raise NotImplementedError
+
+    def student_waitlists(self, email):
+        """Return the sorted names of the activities a student is waiting for"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryStore(ActivityStore):
+    """Dict-backed store with one lock per activity and an optional journal"""
+
+    def __init__(self, catalogue, journal_dir=None, flush_interval=0.005,
+                 compact_interval=300.0, change_log_size=1024, waitlists=True):
+        self.instance_id = uuid.uuid4().hex[:8]
+        self.waitlists = waitlists
+        # Replaced as a whole when activities are added or removed, so
+        # readers iterating it never see a half-applied catalogue
+        self._activities = {
+            name: self._new_activity(details) for name, details in catalogue.items()
+        }
+        # Guarded by the activity's lock, like its participants
+        self._waitlists = {name: Waitlist() for name in self._activities}
+
+        # Restore enrollments before building anything derived from them
+        last_seq = self._restore(journal_dir) if journal_dir else 0
+
+        # Reverse index of student email -> names of the activities they are in
+        self._students = {}
+        for name, details in self._activities.items():
+            for email in details["participants"]:
+                self._students.setdefault(email, set()).add(name)
+
+        # One lock per activity, so signups for different activities never
+        # contend. _index_lock guards the reverse index and the version; it
+        # is held only briefly, always inside an activity lock.
+        self._locks = {name: threading.Lock() for name in self._activities}
+        self._index_lock = threading.Lock()
+        # Serializes update_catalogue() calls
+        self._catalogue_lock = threading.Lock()
+        self._version = 0
+        # Most recent change events, oldest first, guarded by _index_lock
+        self._changes = collections.deque(maxlen=change_log_size)
+
+        self._journal = None
+        if journal_dir:
+            self._journal = journal_log.Journal(
+                journal_dir,
+                snapshot=self._journal_state,
+                flush_interval=flush_interval,
+                compact_interval=compact_interval,
+                start_seq=last_seq,
+            )
+
+    def _restore(self, directory):
+        """Replay the snapshot and journal into the catalogue; returns the last seq"""
+        state, records, last_seq = journal_log.load(directory)
+        for name, emails in state.get("participants", {}).items():
+            if name in self._activities:
+                self._activities[name]["participants"] = ParticipantRoster(emails)
+        for name, emails in state.get("waitlists", {}).items():
+            if name in self._waitlists:
+                self._waitlists[name] = Waitlist(emails)
+        for record in records:
+            name, op, email = record["activity"], record["op"], record["email"]
+            activity = self._activities.get(name)
+            if activity is None:
+                continue
+            participants = activity["participants"]
+            waitlist = self._waitlists[name]
+            if op in ("signup", "promote"):
+                waitlist.leave(email)
+                participants.add(email)
+            elif op == "unregister":
+                participants.discard(email)
+            elif op == "waitlist" and email not in participants:
+                waitlist.join(email)
+            elif op == "leave":
+                waitlist.leave(email)
+        return last_seq
+
+    @staticmethod
+    def _new_activity(details):
+        return {
+            **{field: details[field] for field in CATALOGUE_FIELDS},
+            "participants": ParticipantRoster(details["participants"]),
+        }
+
+    def _journal_state(self):
+        """Rosters and waitlists for a journal snapshot"""
+        participants = {}
+        waitlists = {}
+        for name, details in self._activities.items():
+            with self._locks[name]:
+                participants[name] = details["participants"].to_list()
+                waitlists[name] = self._waitlists[name].to_list()
+        return {"participants": participants, "waitlists": waitlists}
+
+    def _sync(self):
+        # Wait for durability only after the activity lock is released
+        if self._journal is not None:
+            self._journal.sync()
+
+    @property
+    def version(self):
+        return self._version
+
+    def _copy(self, name, details):
+        with self._locks[name]:
+            return {**details, "participants": details["participants"].to_list()}
+
+    def snapshot(self):
+        # Read the version first: a write racing the copy only makes the
+        # catalogue newer than its version, which readers re-fetch later
+        version = self._version
+        return version, {
+            name: self._copy(name, details) for name, details in self._activities.items()
+        }
+
+    def get_activity(self, name):
+        details = self._activities.get(name)
+        if details is None:
+            return None
+        return self._copy(name, details)
+
+    def activity_snapshot(self, name):
+        details = self._activities.get(name)
+        if details is None:
+            return self._version, None
+        # Changes to an activity are versioned under its lock, so the
+        # version read there matches the copy
+        with self._locks[name]:
+            return self._version, {**details, "participants": details["participants"].to_list()}
+
+    def has_activity(self, name):
+        return name in self._activities
+
+    def add_participants(self, name, emails, join_waitlist=True):
+        activity = self._activities.get(name)
+        if activity is None:
+            return ["unknown_activity"] * len(emails)
+
+        statuses = []
+        with self._locks[name]:
+            participants = activity["participants"]
+            waitlist = self._waitlists[name]
+            for email in emails:
+                if email in participants:
+                    statuses.append("duplicate")
+                elif email in waitlist:
+                    statuses.append("waitlisted")
+                elif len(participants) < activity["max_participants"]:
+                    participants.add(email)
+                    self._record("signup", name, activity, email)
+                    statuses.append("enrolled")
+                elif self.waitlists and join_waitlist:
+                    waitlist.join(email)
+                    self._journal_append("waitlist", name, email)
+                    statuses.append("waitlisted")
+                else:
+                    statuses.append("full")
+        self._sync()
+        return statuses
+
+    def remove_participant(self, name, email):
+        activity = self._activities.get(name)
+        if activity is None:
+            return "unknown_activity"
+
+        with self._locks[name]:
+            participants = activity["participants"]
+            waitlist = self._waitlists[name]
+            if participants.discard(email):
+                self._record("unregister", name, activity, email)
+                self._promote(name, activity)
+                status = "removed"
+            elif waitlist.leave(email):
+                self._journal_append("leave", name, email)
+                status = "left_waitlist"
+            else:
+                return "not_enrolled"
+        self._sync()
+        return status
+
+    def _promote(self, name, activity):
+        """Fill free seats from the front of the waitlist; the caller holds
+        the activity lock"""
+        participants = activity["participants"]
+        waitlist = self._waitlists[name]
+        while len(participants) < activity["max_participants"]:
+            email = waitlist.pop()
+            if email is None:
+                return
+            participants.add(email)
+            self._record("promote", name, activity, email)
+
+    def waitlist(self, name):
+        if name not in self._activities:
+            return None
+        with self._locks[name]:
+            return self._waitlists[name].to_list()
+
+    def waitlist_position(self, name, email):
+        waitlist = self._waitlists.get(name)
+        if waitlist is None:
+            return None
+        with self._locks[name]:
+            return waitlist.position(email)
+
+    def _journal_append(self, op, name, email):
+        if self._journal is not None:
+            self._journal.append(op, name, email)
+
+    def _record(self, op, name, activity, email):
+        """Journal, index, log and publish a mutation; the caller holds the
+        activity lock"""
+        self._journal_append(op, name, email)
+        remaining_spots = activity["max_participants"] - len(activity["participants"])
+        with self._index_lock:
+            if op in ("signup", "promote"):
+                self._students.setdefault(email, set()).add(name)
+            else:
+                enrolled = self._students.get(email)
+                if enrolled is not None:
+                    enrolled.discard(name)
+                    if not enrolled:
+                        del self._students[email]
+            self._version += 1
+            event = self._change(op, name, email, remaining_spots, self._version)
+            self._changes.append(event)
+            # Under the lock, so listeners see events in version order
+            self._notify(event)
+
+    def changes_since(self, version):
+        with self._index_lock:
+            current = self._version
+            # The log holds exactly the last len(changes) versions
+            if not current - len(self._changes) <= version <= current:
+                return current, None
+            start = len(self._changes) - (current - version)
+            return current, list(itertools.islice(self._changes, start, None))
+
+    def update_catalogue(self, catalogue):
+        with self._catalogue_lock:
+            current = self._activities
+            changes = diff_catalogue(current, catalogue)
+            if not any(changes):
+                return changes
+
+            for name in changes.added:
+                self._locks.setdefault(name, threading.Lock())
+                self._waitlists[name] = Waitlist()
+            activities = {
+                name: current[name] if name in current else self._new_activity(details)
+                for name, details in catalogue.items()
+            }
+            # Locks are never dropped, so a request that looked up a removed
+            # activity just before the swap still finds its lock
+            self._activities = activities
+
+            for name in changes.added:
+                with self._locks[name]:
+                    with self._index_lock:
+                        for email in activities[name]["participants"]:
+                            self._students.setdefault(email, set()).add(name)
+                    self._record_catalogue(name, activities[name])
+            for name in changes.changed:
+                activity = activities[name]
+                with self._locks[name]:
+                    for field in CATALOGUE_FIELDS:
+                        activity[field] = catalogue[name][field]
+                    self._record_catalogue(name, activity)
+                    self._promote(name, activity)
+            for name in changes.removed:
+                activity = current[name]
+                with self._locks[name]:
+                    with self._index_lock:
+                        for email in activity["participants"]:
+                            enrolled = self._students.get(email)
+                            if enrolled is not None:
+                                enrolled.discard(name)
+                                if not enrolled:
+                                    del self._students[email]
+                    self._waitlists[name] = Waitlist()
+                    self._record_catalogue(name, None)
+        self._sync()
+        return changes
+
+    def _record_catalogue(self, name, activity):
+        """Log and publish a catalogue change; the caller holds the activity
+        lock"""
+        remaining_spots = 0
+        if activity is not None:
+            remaining_spots = activity["max_participants"] - len(activity["participants"])
+        with self._index_lock:
+            self._version += 1
+            event = self._change("catalogue", name, None, remaining_spots, self._version)
+            self._changes.append(event)
+            self._notify(event)
+
+    def participant_counts(self):
+        return {name: len(details["participants"]) for name, details in self._activities.items()}
+
+    def student_activities(self, email):
+        with self._index_lock:
+            return sorted(self._students.get(email, ()))
+
+    def student_waitlists(self, email):
+        return sorted(name for name, waitlist in list(self._waitlists.items()) if email in waitlist)
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    name TEXT PRIMARY KEY,
+    description TEXT NOT NULL,
+    schedule TEXT NOT NULL,
+    max_participants INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS participants (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    activity TEXT NOT NULL REFERENCES activities (name),
+    email TEXT NOT NULL,
+    UNIQUE (activity, email)
+);
+CREATE INDEX IF NOT EXISTS participants_by_email ON participants (email, activity);
+CREATE TABLE IF NOT EXISTS waitlist (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    activity TEXT NOT NULL REFERENCES activities (name),
+    email TEXT NOT NULL,
+    UNIQUE (activity, email)
+);
+CREATE INDEX IF NOT EXISTS waitlist_by_activity ON waitlist (activity, id);
+CREATE INDEX IF NOT EXISTS waitlist_by_email ON waitlist (email, activity);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY,
+    activity TEXT NOT NULL,
+    email TEXT NOT NULL,
+    op TEXT NOT NULL,
+    remaining_spots INTEGER NOT NULL
+);
+"""
+
+
+class SQLiteStore(ActivityStore):
+    """SQLite-backed store in WAL mode, shareable by several processes on one box.
+
+    Connections come from a small pool and every query is a constant
+    parameterised statement, so sqlite3's per-connection statement cache
+    reuses the prepared form. Writes run in BEGIN IMMEDIATE transactions,
+    which makes the capacity check and insert atomic across processes.
+    """
+
+    def __init__(self, path, catalogue, pool_size=8, timeout=5.0, change_log_size=1024,
+                 waitlists=True):
+        self.path = path
+        self.waitlists = waitlists
+        self.timeout = timeout
+        self.change_log_size = change_log_size
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+        with self._connection() as conn:
+            conn.executescript(SQLITE_SCHEMA)
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('instance_id', ?)",
+                (uuid.uuid4().hex[:8],),
+            )
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0')")
+            # Seed rosters only for activities that are new to this database,
+            # so restarts never re-add students who have since unregistered
+            for name, details in catalogue.items():
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO activities (name, description, schedule, max_participants) "
+                    "VALUES (?, ?, ?, ?)",
+                    (name, details["description"], details["schedule"], details["max_participants"]),
+                ).rowcount
+                if inserted:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO participants (activity, email) VALUES (?, ?)",
+                        [(name, email) for email in details["participants"]],
+                    )
+            conn.execute("COMMIT")
+            self.instance_id = conn.execute(
+                "SELECT value FROM meta WHERE key = 'instance_id'"
+            ).fetchone()[0]
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=128,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @staticmethod
+    def _read_version(conn):
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+
+    @staticmethod
+    def _bump_version(conn):
+        return int(conn.execute(
+            "UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version' "
+            "RETURNING value"
+        ).fetchone()[0])
+
+    def _log_change(self, conn, op, name, email, remaining_spots):
+        """Bump the version and record the change in the bounded change log"""
+        version = self._bump_version(conn)
+        conn.execute(
+            "INSERT INTO changes (version, activity, email, op, remaining_spots) "
+            "VALUES (?, ?, ?, ?, ?)",
+            # Catalogue changes have no email
+            (version, name, email or "", op, remaining_spots),
+        )
+        conn.execute("DELETE FROM changes WHERE version <= ?", (version - self.change_log_size,))
+        return self._change(op, name, email, remaining_spots, version)
+
+    @property
+    def version(self):
+        with self._connection() as conn:
+            return self._read_version(conn)
+
+    def changes_since(self, version):
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            current = self._read_version(conn)
+            oldest = conn.execute("SELECT MIN(version) FROM changes").fetchone()[0]
+            if version == current:
+                rows = []
+            elif oldest is None or not oldest - 1 <= version < current:
+                rows = None
+            else:
+                rows = conn.execute(
+                    "SELECT version, activity, email, op, remaining_spots FROM changes "
+                    "WHERE version > ? ORDER BY version",
+                    (version,),
+                ).fetchall()
+            conn.execute("COMMIT")
+        if rows is None:
+            return current, None
+        return current, [
+            self._change(op, name, email or None, remaining_spots, change_version)
+            for change_version, name, email, op, remaining_spots in rows
+        ]
+
+    def snapshot(self):
+        with self._connection() as conn:
+            # One read transaction, so the version matches the rows
+            conn.execute("BEGIN")
+            version = self._read_version(conn)
+            catalogue = {
+                name: {
+                    "description": description,
+                    "schedule": schedule,
+                    "max_participants": max_participants,
+                    "participants": [],
+                }
+                for name, description, schedule, max_participants in conn.execute(
+                    "SELECT name, description, schedule, max_participants "
+                    "FROM activities ORDER BY rowid"
+                )
+            }
+            for activity, email in conn.execute(
+                "SELECT activity, email FROM participants ORDER BY id"
+            ):
+                catalogue[activity]["participants"].append(email)
+            conn.execute("COMMIT")
+        return version, catalogue
+
+    def get_activity(self, name):
+        return self.activity_snapshot(name)[1]
+
+    def activity_snapshot(self, name):
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            version = self._read_version(conn)
+            row = conn.execute(
+                "SELECT description, schedule, max_participants FROM activities WHERE name = ?",
+                (name,),
+            ).fetchone()
+            emails = [
+                email for (email,) in conn.execute(
+                    "SELECT email FROM participants WHERE activity = ? ORDER BY id", (name,)
+                )
+            ]
+            conn.execute("COMMIT")
+        if row is None:
+            return version, None
+        description, schedule, max_participants = row
+        return version, {
+            "description": description,
+            "schedule": schedule,
+            "max_participants": max_participants,
+            "participants": emails,
+        }
+
+    def has_activity(self, name):
+        with self._connection() as conn:
+            return conn.execute(
+                "SELECT 1 FROM activities WHERE name = ?", (name,)
+            ).fetchone() is not None
+
+    def add_participants(self, name, emails, join_waitlist=True):
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT max_participants FROM activities WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return ["unknown_activity"] * len(emails)
+
+            max_participants = row[0]
+            count = conn.execute(
+                "SELECT COUNT(*) FROM participants WHERE activity = ?", (name,)
+            ).fetchone()[0]
+            statuses = []
+            events = []
+            for email in emails:
+                if count >= max_participants:
+                    already = conn.execute(
+                        "SELECT 1 FROM participants WHERE activity = ? AND email = ?",
+                        (name, email),
+                    ).fetchone()
+                    if already:
+                        statuses.append("duplicate")
+                    elif self.waitlists and join_waitlist:
+                        conn.execute(
+                            "INSERT OR IGNORE INTO waitlist (activity, email) VALUES (?, ?)",
+                            (name, email),
+                        )
+                        statuses.append("waitlisted")
+                    else:
+                        statuses.append("full")
+                    continue
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO participants (activity, email) VALUES (?, ?)",
+                    (name, email),
+                ).rowcount
+                if inserted:
+                    count += 1
+                    events.append(self._log_change(
+                        conn, "signup", name, email, max_participants - count
+                    ))
+                    statuses.append("enrolled")
+                else:
+                    statuses.append("duplicate")
+            conn.execute("COMMIT")
+        for event in events:
+            self._notify(event)
+        return statuses
+
+    def remove_participant(self, name, email):
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            events = []
+            deleted = conn.execute(
+                "DELETE FROM participants WHERE activity = ? AND email = ?", (name, email)
+            ).rowcount
+            if deleted:
+                remaining_spots = conn.execute(
+                    "SELECT a.max_participants - COUNT(p.id) FROM activities a "
+                    "LEFT JOIN participants p ON p.activity = a.name WHERE a.name = ?",
+                    (name,),
+                ).fetchone()[0]
+                events.append(self._log_change(conn, "unregister", name, email, remaining_spots))
+                events.extend(self._promote(conn, name, remaining_spots))
+                status = "removed"
+            elif conn.execute(
+                "DELETE FROM waitlist WHERE activity = ? AND email = ?", (name, email)
+            ).rowcount:
+                status = "left_waitlist"
+            elif conn.execute(
+                "SELECT 1 FROM activities WHERE name = ?", (name,)
+            ).fetchone() is None:
+                status = "unknown_activity"
+            else:
+                status = "not_enrolled"
+            conn.execute("COMMIT")
+        for event in events:
+            self._notify(event)
+        return status
+
+    def _promote(self, conn, name, remaining_spots):
+        """Hand free seats to the front of the waitlist inside the caller's
+        transaction; returns the change events"""
+        events = []
+        while remaining_spots > 0:
+            row = conn.execute(
+                "DELETE FROM waitlist WHERE id = ("
+                "SELECT id FROM waitlist WHERE activity = ? ORDER BY id LIMIT 1"
+                ") RETURNING email",
+                (name,),
+            ).fetchone()
+            if row is None:
+                break
+            conn.execute(
+                "INSERT INTO participants (activity, email) VALUES (?, ?)", (name, row[0])
+            )
+            remaining_spots -= 1
+            events.append(self._log_change(conn, "promote", name, row[0], remaining_spots))
+        return events
+
+    def update_catalogue(self, catalogue):
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            current = {
+                name: {
+                    "description": description,
+                    "schedule": schedule,
+                    "max_participants": max_participants,
+                }
+                for name, description, schedule, max_participants in conn.execute(
+                    "SELECT name, description, schedule, max_participants FROM activities"
+                )
+            }
+            changes = diff_catalogue(current, catalogue)
+            events = []
+            for name in changes.added:
+                details = catalogue[name]
+                conn.execute(
+                    "INSERT INTO activities (name, description, schedule, max_participants) "
+                    "VALUES (?, ?, ?, ?)",
+                    (name, details["description"], details["schedule"], details["max_participants"]),
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO participants (activity, email) VALUES (?, ?)",
+                    [(name, email) for email in details["participants"]],
+                )
+            for name in changes.changed:
+                details = catalogue[name]
+                conn.execute(
+                    "UPDATE activities SET description = ?, schedule = ?, max_participants = ? "
+                    "WHERE name = ?",
+                    (details["description"], details["schedule"], details["max_participants"], name),
+                )
+            for name in changes.removed:
+                conn.execute("DELETE FROM participants WHERE activity = ?", (name,))
+                conn.execute("DELETE FROM waitlist WHERE activity = ?", (name,))
+                conn.execute("DELETE FROM activities WHERE name = ?", (name,))
+                events.append(self._log_change(conn, "catalogue", name, None, 0))
+            for name in (*changes.added, *changes.changed):
+                remaining_spots = conn.execute(
+                    "SELECT a.max_participants - COUNT(p.id) FROM activities a "
+                    "LEFT JOIN participants p ON p.activity = a.name WHERE a.name = ?",
+                    (name,),
+                ).fetchone()[0]
+                events.append(self._log_change(conn, "catalogue", name, None, remaining_spots))
+                events.extend(self._promote(conn, name, remaining_spots))
+            conn.execute("COMMIT")
+        for event in events:
+            self._notify(event)
+        return changes
+
+    def waitlist(self, name):
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            exists = conn.execute(
+                "SELECT 1 FROM activities WHERE name = ?", (name,)
+            ).fetchone() is not None
+            emails = [
+                email for (email,) in conn.execute(
+                    "SELECT email FROM waitlist WHERE activity = ? ORDER BY id", (name,)
+                )
+            ]
+            conn.execute("COMMIT")
+        return emails if exists else None
+
+    def waitlist_position(self, name, email):
+        with self._connection() as conn:
+            position = conn.execute(
+                "SELECT COUNT(*) FROM waitlist WHERE activity = ? AND id <= ("
+                "SELECT id FROM waitlist WHERE activity = ? AND email = ?)",
+                (name, name, email),
+            ).fetchone()[0]
+        return position or None
+
+    def participant_counts(self):
+        with self._connection() as conn:
+            return dict(conn.execute(
+                "SELECT a.name, COUNT(p.id) FROM activities a "
+                "LEFT JOIN participants p ON p.activity = a.name "
+                "GROUP BY a.name ORDER BY a.rowid"
+            ))
+
+    def student_activities(self, email):
+        with self._connection() as conn:
+            return [
+                activity for (activity,) in conn.execute(
+                    "SELECT activity FROM participants WHERE email = ? ORDER BY activity",
+                    (email,),
+                )
+            ]
+
+    def student_waitlists(self, email):
+        with self._connection() as conn:
+            return [
+                activity for (activity,) in conn.execute(
+                    "SELECT activity FROM waitlist WHERE email = ? ORDER BY activity",
+                    (email,),
+                )
+            ]
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,95 @@
+"""
+FIFO waitlist for a full activity.
+
+Each student who joins gets an increasing ticket number and is appended to
+a deque. Leaving the line only forgets the ticket; the stale deque entry is
+skipped when it reaches the front, so joining, leaving and promoting the
+next student are all O(1) amortized.
+
+A student's position is their ticket minus the ticket at the front, less
+the students ahead of them who have left. Those cancellations are kept in
+a small sorted list that is trimmed as the front moves past them, so
+position is O(1) when nobody ahead has left and O(log c) otherwise, where
+c is the number of pending cancellations.
+"""
+
+import bisect
+from collections import deque
+
+
+class Waitlist:
+    """Queue of emails waiting for a seat, oldest first"""
+
+    __slots__ = ("_queue", "_tickets", "_cancelled", "_next_ticket")
+
+    def __init__(self, emails=()):
+        # (ticket, email), including entries cancelled but not yet skipped
+        self._queue = deque()
+        # email -> ticket for everyone still waiting
+        self._tickets = {}
+        # Sorted tickets of cancelled entries still in _queue
+        self._cancelled = []
+        self._next_ticket = 0
+        for email in emails:
+            self.join(email)
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def __contains__(self, email):
+        return email in self._tickets
+
+    def __iter__(self):
+        for ticket, email in self._queue:
+            if self._tickets.get(email) == ticket:
+                yield email
+
+    def join(self, email):
+        """Add a student to the back; returns False if already waiting"""
+        if email in self._tickets:
+            return False
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        self._tickets[email] = ticket
+        self._queue.append((ticket, email))
+        return True
+
+    def leave(self, email):
+        """Remove a student from the line; returns whether they were in it"""
+        ticket = self._tickets.pop(email, None)
+        if ticket is None:
+            return False
+        bisect.insort(self._cancelled, ticket)
+        self._skip_cancelled()
+        return True
+
+    def pop(self):
+        """Remove and return the student at the front, or None if empty"""
+        self._skip_cancelled()
+        if not self._queue:
+            return None
+        _, email = self._queue.popleft()
+        del self._tickets[email]
+        self._skip_cancelled()
+        return email
+
+    def position(self, email):
+        """Return the 1-based place in line, or None if not waiting"""
+        ticket = self._tickets.get(email)
+        if ticket is None:
+            return None
+        ahead = ticket - self._queue[0][0]
+        if self._cancelled:
+            ahead -= bisect.bisect_left(self._cancelled, ticket)
+        return ahead + 1
+
+    def to_list(self):
+        return list(self)
+
+    def _skip_cancelled(self):
+        # Keep a live entry at the front so position() can use its ticket
+        queue = self._queue
+        cancelled = self._cancelled
+        while queue and cancelled and queue[0][0] == cancelled[0]:
+            queue.popleft()
+            cancelled.pop(0)